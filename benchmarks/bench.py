@@ -0,0 +1,238 @@
+"""
+Benchmarks for the parse, generate and convert paths.
+
+Builds synthetic mission notebooks and yaml files of a configurable size, times
+each stage on them separately, measures peak memory with tracemalloc, and writes
+the results as JSON.  Passing --baseline compares against an earlier results file
+and fails if any stage got slower by more than --tolerance.
+
+    python benchmarks/bench.py --screens 10,100,400 --output bench.json
+    python benchmarks/bench.py --screens 10,100,400 --baseline bench.json
+
+Stages whose optional dependencies (IPython) aren't installed are reported as
+skipped.  The parse cache is turned off so every run measures real parsing.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ["DQAUTHOR_NO_CACHE"] = "1"
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+from dqauthorkit import dqauthorkit as dq
+
+
+def make_notebook(screens, setup_lines, file_list, output_bytes):
+    """Build the json for a mission notebook with `screens` code screens."""
+    source = ['<!-- mission_number=1 file_list={0} mode="singlescreen" -->\n'.format(json.dumps(file_list)),
+              "# Synthetic mission\n", "## A generated mission for benchmarks\n", "## Benchmarks"]
+    cells = [{"cell_type": "markdown", "metadata": {}, "source": source}]
+    for i in range(screens):
+        cells.append({
+            "cell_type": "markdown",
+            "metadata": {},
+            "source": '<!-- type="code" -->\n\n# Screen {0}\n\nSome explanation of screen {0}.\n\n## Instructions\n\nAssign y{0}.\n\n## Hint\n\nUse x{0}.'.format(i)
+        })
+        setup = "\n".join("x{0}_{1} = {1} * 2".format(i, j) for j in range(setup_lines))
+        code = "## Initial\n\n{0}\nx{1} = {1}\n\n## Display\n\nprint(x{1})\n\n## Answer\n\ny{1} = x{1} + 1\n\n## Check vars\n\n['y{1}']\n\n## Check val\n\n\"{1}\"".format(setup, i)
+        cells.append({
+            "cell_type": "code",
+            "execution_count": i + 1,
+            "metadata": {},
+            "outputs": [{"output_type": "stream", "name": "stdout", "text": ["x" * output_bytes]}],
+            "source": code
+        })
+    return {
+        "cells": cells,
+        "metadata": {"kernelspec": {"name": "python3", "display_name": "Python 3", "language": "python"}},
+        "nbformat": 4,
+        "nbformat_minor": 0
+    }
+
+
+def build_corpus(root, screens, setup_lines, data_files, data_kb, output_bytes):
+    """Write a notebook, its data files and the generated yaml under root."""
+    file_list = ["data{0}.csv".format(i) for i in range(data_files)]
+    for f in file_list:
+        with open(os.path.join(root, f), "w") as data_file:
+            data_file.write("a,b\n" + "1,2\n" * (data_kb * 256))
+    nb = make_notebook(screens, setup_lines, file_list, output_bytes)
+    nb_path = os.path.join(root, "Mission1.ipynb")
+    with open(nb_path, "w") as nb_file:
+        json.dump(nb, nb_file, indent=1)
+
+    generator = dq.GenerateMissions(args=argparse.Namespace())
+    meta, parsed_screens = generator.parse_notebook(nb)
+    mission_dir = os.path.join(root, "missions", "1")
+    os.makedirs(mission_dir)
+    yaml_path = os.path.join(mission_dir, "1.yaml")
+    generator.write_yaml(yaml_path, meta, parsed_screens)
+    for f in file_list:
+        shutil.copy2(os.path.join(root, f), os.path.join(mission_dir, f))
+    return {
+        "root": root,
+        "notebook": nb,
+        "notebook_path": nb_path,
+        "meta": meta,
+        "screens": parsed_screens,
+        "yaml_path": yaml_path
+    }
+
+
+def bench_parse_notebook(corpus):
+    generator = dq.GenerateMissions(args=argparse.Namespace())
+    return lambda: generator.parse_notebook(corpus["notebook"])
+
+
+def bench_generate_yaml(corpus):
+    generator = dq.GenerateMissions(args=argparse.Namespace())
+    return lambda: generator.generate_yaml(corpus["meta"], corpus["screens"])
+
+
+def bench_mission_loader(corpus):
+    return lambda: dq.mission_loader(corpus["yaml_path"])
+
+
+def bench_convert_yaml(corpus):
+    final_dir = os.path.join(corpus["root"], "converted")
+    os.makedirs(final_dir)
+    command = dq.YAMLToIPythonCommand(args=argparse.Namespace(path=corpus["yaml_path"], final_dir=final_dir, watch=False))
+    return command.run
+
+
+def bench_load_notebook(corpus):
+    generator = dq.GenerateMissions(args=argparse.Namespace())
+    return lambda: generator.load_notebook(corpus["notebook_path"])
+
+
+def bench_strip_output(corpus):
+    command = dq.StripOutputCommand(args=argparse.Namespace())
+
+    def run():
+        with open(corpus["notebook_path"], "r") as infile:
+            with open(os.devnull, "w") as outfile:
+                command.strip_stream(infile, outfile)
+    return run
+
+
+def bench_html_preprocessor(corpus):
+    from IPython import nbformat
+    from dqauthorkit.nbconvert_html.preprocessor import HTMLPreprocessor
+    text = json.dumps(corpus["notebook"])
+    preprocessor = HTMLPreprocessor()
+
+    def run():
+        nb = nbformat.reads(text, as_version=nbformat.NO_CONVERT)
+        preprocessor.preprocess(nb, {})
+    return run
+
+
+STAGES = [
+    ("parse_notebook", bench_parse_notebook),
+    ("load_notebook", bench_load_notebook),
+    ("generate_yaml", bench_generate_yaml),
+    ("mission_loader", bench_mission_loader),
+    ("convert_yaml", bench_convert_yaml),
+    ("strip_output", bench_strip_output),
+    ("html_preprocessor", bench_html_preprocessor)
+]
+
+
+def measure(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def run_benchmarks(args):
+    results = {}
+    for screens in args.screens:
+        root = tempfile.mkdtemp(prefix="dqauthor-bench-")
+        try:
+            corpus = build_corpus(root, screens, args.setup_lines, args.data_files, args.data_kb, args.output_bytes)
+            for name, setup in STAGES:
+                key = "{0}[screens={1}]".format(name, screens)
+                try:
+                    run = setup(corpus)
+                    results[key] = measure(run, args.repeat)
+                except ImportError as e:
+                    results[key] = {"skipped": str(e)}
+                    print("{0:<40} skipped ({1})".format(key, e))
+                    continue
+                print("{0:<40} {1:>10.2f}ms {2:>10.1f}KB".format(
+                    key, results[key]["seconds"] * 1000, results[key]["peak_bytes"] / 1024.0))
+        finally:
+            shutil.rmtree(root)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the stages that got slower than the baseline by more than tolerance."""
+    regressions = []
+    for key, result in sorted(results.items()):
+        old = baseline.get("results", {}).get(key)
+        if old is None or "seconds" not in old or "seconds" not in result:
+            continue
+        ratio = result["seconds"] / max(old["seconds"], 1e-9)
+        if ratio > 1 + tolerance:
+            regressions.append((key, old["seconds"], result["seconds"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dqauthor parse, generate and convert paths.")
+    parser.add_argument("--screens", type=lambda v: [int(i) for i in v.split(",")], default=[10, 100, 400],
+                        help="Comma separated screen counts to build missions with.")
+    parser.add_argument("--setup-lines", type=int, default=20, help="Lines of setup code per screen.")
+    parser.add_argument("--data-files", type=int, default=3, help="Number of files in each file_list.")
+    parser.add_argument("--data-kb", type=int, default=256, help="Size of each data file in KB.")
+    parser.add_argument("--output-bytes", type=int, default=4096, help="Size of each cell's output.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per stage (the best one counts).")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="A results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline.")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    data = {
+        "meta": {
+            "version": dq.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "setup_lines": args.setup_lines,
+            "data_files": args.data_files,
+            "data_kb": args.data_kb,
+            "output_bytes": args.output_bytes
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for key, old, new, ratio in regressions:
+            print("Regression in {0}: {1:.2f}ms -> {2:.2f}ms ({3:.2f}x)".format(key, old * 1000, new * 1000, ratio))
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Check that importing the dqauthor CLI stays cheap.
+
+Runs `python -X importtime` on the CLI module in a fresh interpreter, fails if
+the cumulative import time goes over the budget or if any of the heavy
+dependencies that only some commands need get imported at startup.
+
+    python benchmarks/import_time.py --budget-ms 50
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "dqauthorkit.dqauthorkit"
+HEAVY_MODULES = ["requests", "IPython", "yaml", "multiprocessing", "concurrent.futures.process"]
+
+
+def measure(module, runs):
+    """Return the best cumulative import time (in microseconds) and the modules it imported."""
+    best = None
+    imported = set()
+    env = dict(os.environ, PYTHONPATH=ROOT_PATH)
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {0}".format(module)],
+                              stderr=subprocess.PIPE, env=env, cwd=ROOT_PATH, universal_newlines=True)
+        if proc.returncode != 0:
+            print(proc.stderr)
+            sys.exit(proc.returncode)
+        total = 0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            parts = [p.strip() for p in line.split(":", 1)[1].split("|")]
+            if not parts[0].isdigit():
+                continue
+            name = parts[2]
+            imported.add(name.strip())
+            # Top level imports aren't indented, and their cumulative time includes their
+            # children.  Interpreter startup (site, encodings) isn't ours to budget.
+            if name == name.lstrip() and name.split(".")[0] == module.split(".")[0]:
+                total += int(parts[1])
+        best = total if best is None else min(best, total)
+    return best, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the dqauthor CLI.")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="The maximum cumulative import time.")
+    parser.add_argument("--runs", type=int, default=5, help="How many times to measure (the best run counts).")
+    args = parser.parse_args()
+
+    total, imported = measure(MODULE, args.runs)
+    print("Importing {0} took {1:.1f}ms (budget {2:.1f}ms).".format(MODULE, total / 1000.0, args.budget_ms))
+    failed = False
+    heavy = sorted(m for m in HEAVY_MODULES if m in imported)
+    if len(heavy) > 0:
+        print("Heavy modules imported at startup: {0}".format(", ".join(heavy)))
+        failed = True
+    if total / 1000.0 > args.budget_ms:
+        print("Import time is over budget.")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import sys
+
+from .manifest import atomic_path, hash_file
+
+ASSET_STORE_DIRNAME = ".dqauthor-assets"
+# ioctl request to clone a file on copy-on-write file systems (btrfs, xfs) on linux.
+FICLONE = 0x40049409
+
+
+def same_contents(src, dest, src_hash=None):
+    """Check whether dest already holds the contents of src, hashing only as a last resort."""
+    try:
+        dest_st = os.stat(dest)
+    except OSError:
+        return False
+    src_st = os.stat(src)
+    if (src_st.st_dev, src_st.st_ino) == (dest_st.st_dev, dest_st.st_ino):
+        return True
+    if src_st.st_size != dest_st.st_size:
+        return False
+    if src_st.st_mtime == dest_st.st_mtime:
+        return True
+    if src_hash is None:
+        src_hash = hash_file(src)
+    return src_hash == hash_file(dest)
+
+
+def reflink(src, dest):
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflinks are only supported on linux")
+    import fcntl
+    with open(src, "rb") as src_file:
+        with open(dest, "wb") as dest_file:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dest)
+
+
+def clone_file(src, dest):
+    """
+    Copy src to dest, sharing the data blocks when the file system supports it.
+    dest is replaced atomically, so any hardlinks to the old dest are left alone.
+    """
+    with atomic_path(dest) as tmp_path:
+        try:
+            reflink(src, tmp_path)
+            method = "reflink"
+        except (OSError, IOError):
+            shutil.copy2(src, tmp_path)
+            method = "copy"
+    return method
+
+
+class AssetStore(object):
+    """
+    A content-addressed store of data files.
+
+    Every distinct file is kept once, named by its hash, and hardlinked into the
+    missions that use it.  Generated copies are replaced rather than written to, so
+    the store is never modified through a link.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Whether stored files can be hardlinked onto each device, see can_link.
+        self.linkable = {}
+
+    def store_path(self, file_hash):
+        return os.path.join(self.path, file_hash[:2], file_hash)
+
+    def add(self, src, file_hash):
+        store_path = self.store_path(file_hash)
+        if not os.path.exists(store_path):
+            if not os.path.exists(os.path.dirname(store_path)):
+                os.makedirs(os.path.dirname(store_path))
+            clone_file(src, store_path)
+        return store_path
+
+    def can_link(self, dest_dir):
+        """Check, once per device, whether files in the store can be hardlinked into dest_dir."""
+        import tempfile
+        device = os.stat(dest_dir).st_dev
+        if device not in self.linkable:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            fd, probe = tempfile.mkstemp(prefix=".probe-", dir=self.path)
+            os.close(fd)
+            probe_link = os.path.join(dest_dir, os.path.basename(probe))
+            try:
+                os.link(probe, probe_link)
+                os.remove(probe_link)
+                self.linkable[device] = True
+            except OSError:
+                self.linkable[device] = False
+            finally:
+                os.remove(probe)
+        return self.linkable[device]
+
+    def link(self, store_path, dest):
+        with atomic_path(dest) as tmp_path:
+            os.link(store_path, tmp_path)
+
+    def prune(self):
+        """Remove stored files that no mission links to anymore."""
+        if not os.path.isdir(self.path):
+            return
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for f in filenames:
+                full_path = os.path.join(dirpath, f)
+                if os.stat(full_path).st_nlink == 1:
+                    os.remove(full_path)
+
+
+def stage_asset(src, dest, store=None, src_hash=None):
+    """
+    Make dest a copy of src, doing as little I/O as possible.
+
+    Nothing is written if dest already matches.  Otherwise dest is hardlinked from
+    the store (when one is given and dest can link to it), cloned with a reflink, or
+    copied, in that order of preference.  Returns how the file was staged.
+    """
+    if same_contents(src, dest, src_hash):
+        return "unchanged"
+    if store is not None and store.can_link(os.path.dirname(os.path.abspath(dest))):
+        if src_hash is None:
+            src_hash = hash_file(src)
+        try:
+            store.link(store.add(src, src_hash), dest)
+            return "hardlink"
+        except OSError:
+            pass
+    return clone_file(src, dest)
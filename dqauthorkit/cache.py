@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pickle
+
+from .manifest import atomic_write
+
+CACHE_PATH = os.environ.get("DQAUTHOR_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "dqauthorkit")
+CACHE_MAX_BYTES = int(os.environ.get("DQAUTHOR_CACHE_SIZE", 128 * 1024 * 1024))
+# Part of every key.  Bump it whenever what is cached changes shape, like the
+# classes in model.py or what the parsers fill them with, so older entries are
+# never unpickled into objects the code doesn't expect.
+CACHE_FORMAT = 2
+
+
+class ParseCache(object):
+    """
+    Parsed notebooks and missions, pickled to disk and keyed by the hash of the
+    file they came from, the version of dqauthorkit that parsed them and
+    CACHE_FORMAT.
+
+    Reading an entry bumps its mtime, and the least recently used entries are
+    evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, version, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.version = version
+        self.path = path
+        self.max_bytes = max_bytes
+        # Size of the cache as far as this process knows, so it is only scanned once.
+        self.total_bytes = None
+
+    def entry_path(self, kind, content_hash):
+        key = hashlib.sha1("{0}:{1}:{2}:{3}".format(kind, CACHE_FORMAT, self.version, content_hash).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key[:2], key + ".pickle")
+
+    def get(self, kind, content_hash):
+        entry_path = self.entry_path(kind, content_hash)
+        try:
+            with open(entry_path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(entry_path, None)
+        except (OSError, IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        return value
+
+    def set(self, kind, content_hash, value):
+        entry_path = self.entry_path(kind, content_hash)
+        try:
+            if not os.path.exists(os.path.dirname(entry_path)):
+                os.makedirs(os.path.dirname(entry_path))
+            with atomic_write(entry_path, "wb") as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        except (OSError, IOError):
+            # The cache is only an optimization, so a read-only or full disk isn't an error.
+            return
+        if self.total_bytes is None:
+            self.evict()
+        else:
+            self.total_bytes += os.path.getsize(entry_path)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for f in filenames:
+                full_path = os.path.join(dirpath, f)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, full_path))
+                total += st.st_size
+        for mtime, size, full_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(full_path)
+            except OSError:
+                continue
+            total -= size
+        self.total_bytes = total
+
+
+_cache = None
+
+
+def get_cache(version):
+    """Return the shared parse cache, or None if DQAUTHOR_NO_CACHE is set."""
+    global _cache
+    if os.environ.get("DQAUTHOR_NO_CACHE"):
+        return None
+    if _cache is None:
+        _cache = ParseCache(version)
+    return _cache
@@ -4,68 +4,140 @@ import sys
 import argparse
 import os
 import getpass
-import requests
+import glob
+import hashlib
 import json
 import re
-import shutil
 import time
 import sys
 import ast
-import subprocess
-from IPython import nbformat
+import itertools
+from .exceptions import InvalidPythonError, InvalidFormatError, UserQuitException, ServerFailureException
+from .profiling import span, start_profiling, stop_profiling
+from .parsing import iter_lines, split_sections, parse_metadata, quote_metadata_value
+from .model import Mission, Screen
+from .assets import ASSET_STORE_DIRNAME, AssetStore, stage_asset
+from .cache import get_cache
+from .validate import CACHE_KIND as VALIDATE_CACHE_KIND, SCREEN_CACHE_KIND as VALIDATE_SCREEN_CACHE_KIND, check_mission_meta, check_notebook, check_screen, screen_hash
+from .runner import LOCAL_PRELOAD, SCREEN_TIMEOUT, run_mission, warm_worker
+from .notebook import new_code_cell, new_markdown_cell, new_notebook, write_notebook, read_notebook, strip_notebook
+from .manifest import BuildManifest, atomic_write, fingerprint, hash_file, write_json_atomic
+from .sync import SyncState, blobs, delta_payload
+from .jobs import job_count, jobs_argument, map_jobs
 import re
-from IPython.nbformat import current as nbf
 
 TOKEN_FILE_PATH = os.path.join(os.path.expanduser("~"), ".dataquest")
-DATAQUEST_BASE_URL = "https://www.dataquest.io/api/v1/"
+SOURCE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".dataquest_sources")
+# Seconds the cached mission source list is used without asking the server.
+SOURCE_CACHE_TTL = 300
+# Set DATAQUEST_BASE_URL to point the commands at another server, like tools/sync_server.py.
+DATAQUEST_BASE_URL = os.environ.get("DATAQUEST_BASE_URL", "https://www.dataquest.io/api/v1/").rstrip("/") + "/"
 DATAQUEST_TOKEN_URL = "{0}{1}".format(DATAQUEST_BASE_URL, "accounts/get_auth_token/")
 DATAQUEST_MISSION_SOURCE_URL = "{0}{1}".format(DATAQUEST_BASE_URL, "missions/mission_sources/")
 DATAQUEST_TASK_STATUS_URL = "{0}{1}".format(DATAQUEST_BASE_URL, "missions/task_status/")
+# (connect, read) timeouts in seconds for every API request.
+REQUEST_TIMEOUT = (10, 60)
+REQUEST_RETRIES = 3
+# Bytes sent in each request when uploading files for a delta sync.
+SYNC_CHUNK_SIZE = 4 * 1024 * 1024
+# Task status polling starts fast and backs off, see poll_api_endpoint.
+POLL_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 10
+POLL_BACKOFF = 1.5
+POLL_DEADLINE = 5000
 BASE_PATH = os.path.dirname(__file__)
 ROOT_PATH = os.path.dirname(BASE_PATH)
 
-class NoAuthenticationError(Exception):
-    pass
-
-class InvalidPythonError(Exception):
-    pass
-
-class InvalidFormatError(Exception):
-    pass
-
-class UserQuitException(Exception):
-    pass
-
-class ServerFailureException(Exception):
-    pass
-
 def get_input():
     return getattr(__builtins__, 'raw_input', input)
 
-def mission_loader(mission_filename):
-    import yaml
-    with open(mission_filename, 'rb') as mission_file:
-        mission_data = mission_file.read()
-
-    mission_data = mission_data.decode("utf-8")
-    mission_data = re.split("-{4,}", mission_data)
-    mission_data = [yaml.safe_load(i) for i in mission_data]
-    meta = mission_data[1]
-    screens = [i for i in mission_data[2:] if i is not None]
-    first_screen = False
-    for i, s in enumerate(screens):
-        if s["type"] == "code" and not first_screen:
-            if "imports" in meta:
-                screens[i]["initial"] = meta["imports"] + "\n\n"
-                first_screen = True
-        if "initial_vars" in s:
-            initial = meta["vars"][int(s["initial_vars"])]
-            if "initial" not in screens[i]:
-                screens[i]["initial"] = initial
+MISSION_SEPARATOR_RE = re.compile(r"^-{4,}\s*$")
+CHECK_VARS_RE = re.compile(r"^check_vars:(.*)$", re.M)
+
+def iter_mission_documents(mission_filename):
+    """
+    Yield the text of each document in a mission file, reading it line by line.
+    Only lines made up entirely of dashes separate documents, so dashes inside a
+    (necessarily indented) block of code don't.
+    """
+    lines = []
+    with open(mission_filename, 'r', encoding='utf-8') as mission_file:
+        for line in mission_file:
+            if MISSION_SEPARATOR_RE.match(line):
+                yield "".join(lines)
+                lines = []
             else:
-                screens[i]["initial"] += initial
+                lines.append(line)
+    yield "".join(lines)
 
+def load_yaml(text):
+    """Load yaml with libyaml's safe loader when it is available."""
+    import yaml
+    return yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+def iter_mission(mission_filename):
+    """
+    Yield the Mission in a mission file, then each of its screens as it is parsed,
+    so callers that stop early don't pay for the rest of the file.
+
+    The vars in the file hold the whole setup of each screen, so each screen gets
+    the part of its var that the var before it doesn't have.  The mission's imports
+    go to the first code screen.
+    """
+    documents = iter_mission_documents(mission_filename)
+    # Anything before the first separator isn't part of the mission.
+    next(documents)
+    meta = load_yaml(next(documents))
+    mission = Mission.from_dict(meta)
+    yield mission
+    imports = mission.imports
+    previous = ""
+    for document in documents:
+        s = load_yaml(document)
+        if s is None:
+            continue
+        var_index = s.pop("initial_vars", None)
+        screen = Screen(s.pop("name", None), s.pop("type", None))
+        for k in s:
+            screen[k] = s[k]
+        # Keep check_vars as written, since loading them as yaml loses their quoting.
+        match = CHECK_VARS_RE.search(document)
+        if match is not None:
+            screen.check_vars = match.group(1).strip()
+        if screen.type == "code":
+            var = meta["vars"][int(var_index)] if var_index is not None else ""
+            # Compare whole lines, so x = 1 isn't taken for the start of x = 10.
+            var = var.rstrip("\n") + "\n" if len(var.strip()) > 0 else ""
+            setup = var[len(previous):] if var.startswith(previous) else var
+            previous = var
+            if imports is not None:
+                setup = imports.strip() + "\n\n" + setup
+                imports = None
+            if len(setup.strip()) > 0:
+                screen.setup = setup.strip()
+        yield mission.add_screen(screen)
+
+def load_mission_meta(mission_filename):
+    """Load only the metadata of a mission, without parsing its screens."""
+    mission = iter_mission(mission_filename)
+    try:
+        return next(mission)
+    finally:
+        mission.close()
 
+def mission_loader(mission_filename):
+    cache = get_cache(__version__)
+    if cache is not None:
+        mission_hash = hash_file(mission_filename)
+        parsed = cache.get("mission", mission_hash)
+        if parsed is not None:
+            return parsed
+    with span("mission_loader.parse", file=mission_filename):
+        mission = iter_mission(mission_filename)
+        meta = next(mission)
+        screens = list(mission)
+    if cache is not None:
+        cache.set("mission", mission_hash, (meta, screens))
     return meta, screens
 
 class BaseCommand(object):
@@ -74,56 +146,128 @@ class BaseCommand(object):
             'dest': 'command',
             'type': str,
             'help': 'The command to run.'
+        },
+        {
+            'flags': ['--profile'],
+            'dest': 'profile',
+            'help': 'Time each stage: summary, chrome:<file> and/or cprofile:<file>, comma separated.  Defaults to $DQAUTHOR_TRACE.'
         }
     ]
 
-    def __init__(self):
+    def __init__(self, args=None):
         self.parser = argparse.ArgumentParser(description='Run helper commands for dataquest.')
         for arg in self.argument_list:
-            self.parser.add_argument(**arg)
-        self.args = self.parser.parse_args()
+            arg = dict(arg)
+            flags = arg.pop('flags', [])
+            self.parser.add_argument(*flags, **arg)
+        if args is None:
+            args = self.parser.parse_args()
+        self.args = args
 
 class StripOutputCommand(BaseCommand):
     command_name = "strip_output"
     argument_list = BaseCommand.argument_list + [
         {
-            'dest': 'file',
+            'dest': 'files',
             'type': str,
-            'help': 'The name of the file you want to strip images from.'
-        }
+            'nargs': '+',
+            'help': 'The notebooks, directories or globs you want to strip images from, or - to filter stdin to stdout.'
+        },
+        jobs_argument("notebooks")
     ]
 
-    def _cells(self, nb):
-        """Yield all cells in an nbformat-insensitive manner"""
-        if nb.nbformat < 4:
-            for ws in nb.worksheets:
-                for cell in ws.cells:
-                    yield cell
-        else:
-            for cell in nb.cells:
-                yield cell
-
-
-    def strip_output(self, nb):
-        """strip the outputs from a notebook object"""
-        nb.metadata.pop('signature', None)
-        for cell in self._cells(nb):
-            if 'outputs' in cell:
-                cell['outputs'] = []
-            if 'prompt_number' in cell:
-                cell['prompt_number'] = None
-        return nb
+    def strip_file(self, path):
+        """
+        Strip a notebook in place, streaming it into a temporary file so outputs are
+        never loaded.  Returns False if there was nothing to strip.
+        """
+        import shutil
+        with atomic_write(path, 'w', encoding='utf-8', newline='') as outfile:
+            with open(path, 'r', encoding='utf-8', newline='') as infile:
+                changed = strip_notebook(infile, outfile)
+            if changed:
+                shutil.copymode(path, outfile.name)
+            outfile.discard = not changed
+        return changed
+
+    def strip_stream(self, infile, outfile):
+        strip_notebook(infile, outfile)
+
+    def find_notebooks(self, paths):
+        notebooks = []
+        for p in paths:
+            p = os.path.abspath(os.path.expanduser(p))
+            if glob.has_magic(p):
+                matches = sorted(glob.glob(p))
+            else:
+                matches = [p]
+            for match in matches:
+                if os.path.isdir(match):
+                    for dirpath, dirnames, filenames in os.walk(match):
+                        dirnames[:] = sorted(d for d in dirnames if d != ".ipynb_checkpoints")
+                        notebooks += [os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith(".ipynb")]
+                elif match.endswith(".ipynb"):
+                    notebooks.append(match)
+                elif not glob.has_magic(p):
+                    raise ValueError(match)
+        return notebooks
 
     def run(self):
-        path = os.path.abspath(os.path.expanduser(self.args.file))
-        if not path.endswith(".ipynb"):
-            raise ValueError
+        if self.args.files == ["-"]:
+            import io
+            # Read and write bytes as utf-8 without newline translation, like strip_file does.
+            infile = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+            outfile = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+            try:
+                self.strip_stream(infile, outfile)
+            finally:
+                outfile.flush()
+                infile.detach()
+                outfile.detach()
+            return
+
+        notebooks = self.find_notebooks(self.args.files)
+        changed = []
+        for path, result, error in map_jobs(strip_file_worker, [(path,) for path in notebooks], self.args.jobs,
+                                            "strip_output.file", (self.args,)):
+            if error is not None:
+                raise error
+            changed.append(result)
+        print("Stripped output from {0} of {1} notebooks.".format(sum(changed), len(notebooks)))
+
+def strip_file_worker(args, path):
+    return StripOutputCommand(args=args).strip_file(path)
+
+_blog_exporter = None
+
+def get_blog_exporter():
+    """
+    Build the markdown exporter for blog posts once per process.  It uses the
+    new_markdown template and HTMLPreprocessor, the same setup nbconvert_html/html.py
+    gives `ipython nbconvert --config`.
+    """
+    global _blog_exporter
+    if _blog_exporter is None:
+        from IPython.config import Config
+        from IPython.nbconvert.exporters import MarkdownExporter
+        from .nbconvert_html.preprocessor import HTMLPreprocessor
 
-        with open(path, 'r') as f:
-            nb = nbformat.read(f, as_version=nbformat.NO_CONVERT)
-        self.strip_output(nb)
-        with open(path, 'w+') as f:
-            nbformat.write(nb, f)
+        template_path = os.path.join(BASE_PATH, "nbconvert_html")
+        c = Config()
+        c.Exporter.template_file = 'new_markdown'
+        c.TemplateExporter.template_path = ['.', template_path]
+        _blog_exporter = MarkdownExporter(config=c)
+        _blog_exporter.register_preprocessor(HTMLPreprocessor, enabled=True)
+    return _blog_exporter
+
+def convert_blog_post(path):
+    """Convert a notebook to a markdown post next to it.  Returns the new path."""
+    from IPython.nbconvert.writers import FilesWriter
+
+    output, resources = get_blog_exporter().from_filename(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    writer = FilesWriter(build_directory=os.path.dirname(path))
+    return writer.write(output, resources, notebook_name=name)
 
 class BlogPostCommand(BaseCommand):
     command_name = "blog_post"
@@ -131,20 +275,33 @@ class BlogPostCommand(BaseCommand):
         {
             'dest': 'path',
             'type': str,
-            'help': 'The path to the mission you want to convert.'
-        }
+            'help': 'The path to the mission you want to convert, or a folder of them.'
+        },
+        jobs_argument("notebooks")
     ]
 
     def run(self):
         path = os.path.abspath(os.path.expanduser(self.args.path))
-        if not path.endswith(".ipynb"):
+        if os.path.isdir(path):
+            nb_files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".ipynb")]
+        elif path.endswith(".ipynb"):
+            nb_files = [path]
+        else:
             raise ValueError
-        filename = os.path.basename(path)
-        filename = filename.replace(".ipynb", ".md")
-        new_path = os.path.join(os.path.dirname(path), filename)
-        template_path = os.path.join(BASE_PATH, "nbconvert_html")
-        config_path = os.path.join(template_path , "html.py")
-        subprocess.call("cd {0} && ipython nbconvert {1} --to markdown --config {2} --output {3}".format(template_path, path, config_path, new_path), shell=True)
+
+        errors = []
+        for (nb_path,), result, error in map_jobs(convert_blog_post, [(nb_path,) for nb_path in nb_files], self.args.jobs, "blog_post.convert"):
+            if error is not None:
+                errors.append((nb_path, error))
+            else:
+                print("Wrote {0}".format(result))
+
+        if len(nb_files) > 1 or len(errors) > 0:
+            print("Converted {0} notebooks, {1} failed.".format(len(nb_files) - len(errors), len(errors)))
+        for nb_path, e in errors:
+            print("  {0}: {1} {2}".format(nb_path, type(e).__name__, e).rstrip())
+        if len(errors) > 0:
+            sys.exit(1)
 
 
 class HelpCommand(BaseCommand):
@@ -161,7 +318,8 @@ class AuthenticateCommand(BaseCommand):
     def run(self):
         email = get_input()("Enter your email for dataquest.io: ").strip()
         password = getpass.getpass("Enter your password: ").strip()
-        resp = requests.post(DATAQUEST_TOKEN_URL, data={"email": email, "password": password})
+        client = get_client()
+        resp = client.post(DATAQUEST_TOKEN_URL, data={"email": email, "password": password}, authenticate=False)
         if resp.status_code == 200:
             data = json.loads(resp.content.decode("utf-8"))
             write_data = {
@@ -170,6 +328,7 @@ class AuthenticateCommand(BaseCommand):
             }
             with open(TOKEN_FILE_PATH, "w+") as tokenfile:
                 json.dump(write_data, tokenfile)
+            client.token = data["token"]
             print("Authentication info written to {0}.  You can now upload and test your missions.".format(TOKEN_FILE_PATH))
         else:
             print("Invalid email or password.  Please try again.")
@@ -186,51 +345,107 @@ class YAMLToIPythonCommand(BaseCommand):
             'dest': 'final_dir',
             'type': str,
             'help': 'The directory you want to move things to.'
+        },
+        {
+            'flags': ['--watch'],
+            'dest': 'watch',
+            'action': 'store_true',
+            'help': 'Keep running and convert the mission again when it changes.'
         }
     ]
 
-    def assemble_mission_meta(self, mission_data):
+    def assemble_metadata(self, metadata):
         text = "<!-- "
-        for k in mission_data:
-            if k in ["vars", "author", "name", "description", "imports"]:
-                continue
+        for k in metadata:
             text += k
             text += "="
-            if isinstance(mission_data[k], str):
-                text += '"'
-            text += str(mission_data[k])
-            if isinstance(mission_data[k], str):
-                text += '"'
+            text += quote_metadata_value(metadata[k])
             text += " "
 
         text += "-->"
         return text
 
-    def assemble_mission_cell(self, mission_data):
-        text = self.assemble_mission_meta(mission_data)
+    def assemble_mission_cell(self, mission):
+        text = self.assemble_metadata(mission.metadata)
         text += "\n\n"
-        text += "# " + mission_data["name"] + "\n"
-        text += "## " + mission_data["description"] + "\n"
-        text += "## " + mission_data["author"]
+        text += "# " + mission.name + "\n"
+        text += "## " + mission.description + "\n"
+        text += "## " + mission.author
         return text
 
-    def assemble_screen_meta(self, screen):
-        text = "<!-- "
-        for k in screen:
-            if k in ["name", "left_text", "initial_display", "answer", "hint", "check_val", "check_code_run", "check_vars", "instructions", "initial_vars", "video", "no_answer_needed", "initial"]:
-                continue
-            text += k
-            text += "="
-            if isinstance(screen[k], str):
-                text += '"'
-            text += str(screen[k])
-            if isinstance(screen[k], str):
-                text += '"'
-            text += " "
+    def assemble_screen_cell(self, screen):
+        metadata = {"type": screen.type}
+        metadata.update(screen.metadata)
+        text = self.assemble_metadata(metadata)
+        text += "\n\n"
+        text += "# " + screen.name
+        text += "\n\n"
+        if screen.type == "code":
+            text += (screen.left_text or "").strip()
+            if screen.instructions is not None:
+                text += "\n\n"
+                text += "## Instructions\n\n"
+                text += screen.instructions.strip()
+            if screen.hint is not None:
+                text += "\n\n"
+                text += "## Hint\n\n"
+                text += screen.hint.strip()
+        elif screen.type == "video":
+            text += screen.video.strip()
+        elif screen.type == "text":
+            text += screen.text.strip()
+        return text
 
-        text += "-->"
+    def assemble_code_cell(self, screen):
+        """
+        Build the code cell of a screen.  Its initial section is only the setup the
+        screen adds to the ones before it, since generate accumulates them again.
+        """
+        sections = [
+            ("## Initial", screen.setup),
+            ("## Display", screen.initial_display),
+            ("## Answer", screen.answer),
+            ("## Check val", screen.check_val),
+            ("## Check vars", screen.check_vars),
+            ("## Check code run", screen.check_code_run)
+        ]
+        sections = [(name, str(value).strip()) for name, value in sections if value is not None and len(str(value).strip()) > 0]
+        if len(sections) == 0:
+            return ""
+        if len(sections) == 1 and sections[0][0] == "## Display":
+            return sections[0][1]
+
+        text = ""
+        for name, value in sections:
+            text += name + "\n\n"
+            if name == "## Check val":
+                text += json.dumps(value, ensure_ascii=False)
+            else:
+                text += value
+            text += "\n\n"
         return text
 
+    def build_notebook(self, path):
+        mission, screens = mission_loader(path)
+        cells = [new_markdown_cell(self.assemble_mission_cell(mission).strip())]
+        for screen in screens:
+            cells.append(new_markdown_cell(self.assemble_screen_cell(screen).strip()))
+            if screen.type == "code":
+                cells.append(new_code_cell(self.assemble_code_cell(screen).strip()))
+        return new_notebook(cells)
+
+    def convert(self, path, final_dest):
+        write_notebook(final_dest, self.build_notebook(path))
+
+    def associated_files(self, original_dir):
+        files = []
+        for f in sorted(os.listdir(original_dir)):
+            full_path = os.path.join(original_dir, f)
+            if os.path.isfile(full_path):
+                if not f.endswith(".yaml") and not f.endswith(".yml") and not f.endswith(".ipynb"):
+                    files.append(full_path)
+        return files
+
     def run(self):
         path = os.path.abspath(os.path.expanduser(self.args.path))
         final_dir = os.path.abspath(os.path.expanduser(self.args.final_dir))
@@ -239,79 +454,122 @@ class YAMLToIPythonCommand(BaseCommand):
         filename = os.path.basename(path)
         new_filename = "Mission" + filename.replace(".yml", ".ipynb").replace(".yaml", ".ipynb")
         final_dest = os.path.join(final_dir, new_filename)
-        mission, screens = mission_loader(path)
-
-        nb = nbf.new_notebook()
-
-        mission_cell = nbf.new_text_cell('markdown', self.assemble_mission_cell(mission).strip())
-        cells = [mission_cell]
-
-        for screen in screens:
-            text = self.assemble_screen_meta(screen)
-            text += "\n\n"
-            if screen["type"] == "code":
-                text += "# " + screen["name"]
-                text += "\n\n"
-                text += screen["left_text"]
-                if "instructions" in screen:
-                    text += "\n\n"
-                    text += "## Instructions\n\n"
-                    text += screen["instructions"]
-                if "hint" in screen:
-                    text += "\n\n"
-                    text += "## Hint\n\n"
-                    text += screen["hint"]
-            elif screen["type"] == "video":
-                text += "# " + screen["name"]
-                text += "\n\n"
-                text += screen["video"]
-            elif screen["type"] == "text":
-                text += "# " + screen["name"]
-                text += "\n\n"
-                text += screen["text"]
-            cell = nbf.new_text_cell('markdown', text.strip())
-            cells.append(cell)
-
-            if screen["type"] == "code":
-                text = ""
-                if "initial" not in screen and "answer" not in screen:
-                    text += screen["initial_display"]
-                else:
-                    items = [
-                        {"key": "initial", "name": "## Initial"},
-                        {"key": "initial_display", "name": "## Display"},
-                        {"key": "answer", "name": "## Answer"},
-                        {"key": "check_val", "name": "## Check val"},
-                        {"key": "check_vars", "name": "## Check vars"},
-                        {"key": "check_code_run", "name": "## Check code run"}
-                    ]
-
-                    for item in items:
-                        if item["key"] in screen and len(str(screen[item["key"]]).strip()) > 0:
-                            if item["key"] == "check_vars" and len(screen[item["key"]]) == 0:
-                                continue
-                            text += item["name"] + "\n\n"
-                            if item["key"] == "check_val":
-                                text += '"' + str(screen[item["key"]]).strip().replace("\n", "\\n") + '"'
-                            else:
-                                text += str(screen[item["key"]]).strip()
-                            text += "\n\n"
-                cell = nbf.new_code_cell(input=text.strip())
-                cells.append(cell)
-
-        nb['worksheets'].append(nbf.new_worksheet(cells=cells))
-
-        with open(final_dest, 'w+') as f:
-            nbf.write(nb, f, 'ipynb')
+        with span("convert_yaml.convert", file=path):
+            self.convert(path, final_dest)
 
         # Copy any associated files over
         original_dir = os.path.dirname(path)
-        for f in os.listdir(original_dir):
-            full_path = os.path.join(original_dir, f)
-            if os.path.isfile(full_path):
-                if not f.endswith(".yaml") and not f.endswith(".yml") and not f.endswith(".ipynb"):
-                    shutil.copy2(full_path, os.path.join(final_dir, f))
+        for full_path in self.associated_files(original_dir):
+            with span("convert_yaml.stage_asset", file=full_path):
+                stage_asset(full_path, os.path.join(final_dir, os.path.basename(full_path)))
+
+        if self.args.watch:
+            from .watch import watch
+
+            def rebuild(changed, removed):
+                for full_path in changed:
+                    # A file caught half saved fails now and is converted again when it is saved.
+                    try:
+                        if full_path == path:
+                            self.convert(path, final_dest)
+                            print("Wrote {0}".format(final_dest))
+                        else:
+                            stage_asset(full_path, os.path.join(final_dir, os.path.basename(full_path)))
+                    except Exception as e:
+                        print("  {0}: {1} {2}".format(full_path, type(e).__name__, e).rstrip())
+
+            watch(lambda: [path] + self.associated_files(original_dir), rebuild)
+
+
+class ConvertMissionsCommand(BaseCommand):
+    command_name = "convert_missions"
+    argument_list = BaseCommand.argument_list + [
+        {
+            'dest': 'path',
+            'type': str,
+            'help': 'The missions folder written by generate, or the folder that holds it.'
+        },
+        {
+            'dest': 'final_dir',
+            'type': str,
+            'nargs': '?',
+            'help': 'The directory to write the notebooks and their files to.'
+        },
+        jobs_argument("missions"),
+        {
+            'flags': ['--check'],
+            'dest': 'check',
+            'action': 'store_true',
+            'help': "Don't write anything, only check that generate turns each converted mission back into the same yaml."
+        }
+    ]
+
+    def find_missions(self, path):
+        if os.path.isdir(os.path.join(path, "missions")):
+            path = os.path.join(path, "missions")
+        missions = []
+        for ext in ["yaml", "yml"]:
+            missions += glob.glob(os.path.join(path, "*", "*." + ext))
+        return sorted(missions)
+
+    def convert_mission(self, yaml_file, final_dir):
+        converter = YAMLToIPythonCommand(args=self.args)
+        mission_number = os.path.splitext(os.path.basename(yaml_file))[0]
+        final_dest = os.path.join(final_dir, "Mission{0}.ipynb".format(mission_number))
+        converter.convert(yaml_file, final_dest)
+        for full_path in converter.associated_files(os.path.dirname(yaml_file)):
+            stage_asset(full_path, os.path.join(final_dir, os.path.basename(full_path)))
+        return final_dest
+
+    def check_mission(self, yaml_file):
+        """Return where the round trip through a notebook changes the yaml, or None if it doesn't."""
+        from .notebook import dumps_notebook
+        nb = YAMLToIPythonCommand(args=self.args).build_notebook(yaml_file)
+        generator = GenerateMissions(args=self.args)
+        mission, screens = generator.parse_notebook(json.loads(dumps_notebook(nb)))
+        with open(yaml_file, "r", encoding="utf-8") as f:
+            original = f.read()
+        if generator.generate_yaml(mission, screens) == original:
+            return None
+        lines = itertools.zip_longest(iter_lines(original), generator.iter_yaml(mission, screens))
+        for i, (expected, actual) in enumerate(lines):
+            if expected != actual:
+                return "line {0}: {1!r} became {2!r}".format(i + 1, expected, actual)
+
+    def process(self, yaml_file):
+        if self.args.check:
+            return self.check_mission(yaml_file)
+        return self.convert_mission(yaml_file, os.path.abspath(os.path.expanduser(self.args.final_dir)))
 
+    def run(self):
+        path = os.path.abspath(os.path.expanduser(self.args.path))
+        if not self.args.check:
+            if self.args.final_dir is None:
+                self.parser.error("final_dir is required unless --check is given.")
+            final_dir = os.path.abspath(os.path.expanduser(self.args.final_dir))
+            if not os.path.exists(final_dir):
+                os.makedirs(final_dir)
+
+        missions = self.find_missions(path)
+        failed = 0
+        for (yaml_file,), result, error in map_jobs(convert_missions_worker, [(yaml_file,) for yaml_file in missions], self.args.jobs,
+                                                    "convert_missions.mission", (self.args,)):
+            if error is not None:
+                failed += 1
+                print("{0}: {1} {2}".format(yaml_file, type(error).__name__, error).rstrip())
+            elif not self.args.check:
+                print("Wrote {0}".format(result))
+            elif result is not None:
+                failed += 1
+                print("{0} doesn't round trip, {1}".format(yaml_file, result))
+
+        print("{0} {1} missions, {2} failed.".format("Checked" if self.args.check else "Converted", len(missions), failed))
+        if failed > 0:
+            sys.exit(1)
+
+def convert_missions_worker(args, yaml_file):
+    """Convert or check a single mission in a worker process."""
+    return ConvertMissionsCommand(args=args).process(yaml_file)
 
 class GenerateMissions(BaseCommand):
     command_name = "generate"
@@ -320,9 +578,26 @@ class GenerateMissions(BaseCommand):
             'dest': 'path',
             'type': str,
             'help': 'The path to your mission folder.'
+        },
+        jobs_argument("notebooks"),
+        {
+            'flags': ['--force'],
+            'dest': 'force',
+            'action': 'store_true',
+            'help': 'Regenerate every notebook, even if it is unchanged since the last run.'
+        },
+        {
+            'flags': ['--watch'],
+            'dest': 'watch',
+            'action': 'store_true',
+            'help': 'Keep running and regenerate notebooks as they change.'
         }
     ]
 
+    def __init__(self, args=None):
+        super(GenerateMissions, self).__init__(args)
+        self.parsed_notebooks = {}
+
     def parse_mission_metadata(self, data):
         data = data.split("\n")
         metadata = self.parse_metadata_string(data[0])
@@ -352,59 +627,32 @@ class GenerateMissions(BaseCommand):
         return metadata
 
     def parse_metadata_string(self, data):
-        if "<!-" not in data:
-            print("Missing metadata string at top of mission/screen.")
-            raise InvalidFormatError()
-
-        data = re.sub("<!-{1,}", "", data)
-        data = re.split("-{1,}>", data)[0]
-        data = data.split("=")
-        values = {}
-        key = None
-        for i, item in enumerate(data):
-            item = item.strip()
-            if key is None:
-                key = item
-            else:
-                vals = item.rsplit(' ', 1)
-                if len(vals) == 2:
-                    item, next_key = vals
-                else:
-                    item = vals[0]
-                if key != "file_list":
-                    item = item.replace("\"", "").replace("'", "")
-                values[key] = item
-                if len(vals) == 2:
-                    key = next_key
-                else:
-                    key = None
-        return values
-
-    def check_for_no_answer(self, screen_info):
-        if "answer" not in screen_info or ("check_vars" not in screen_info and "check_val" not in screen_info and "check_code_run" not in screen_info) or "instructions" not in screen_info:
-            return True
-        return False
+        return parse_metadata(data)
 
     def parse_section(self, data, current_item):
-        lines = data.split("\n")
         items = {current_item: []}
-        for data in lines:
-            if data.startswith("##"):
-                current_item = re.sub("#{1,}", "", data.strip().lower()).strip()
-                if current_item not in items:
-                    items[current_item] = []
-            else:
-                if current_item is not None:
-                    items[current_item] += [data]
+        for section in split_sections(data):
+            name = current_item if section.name is None else section.name
+            if name is None:
+                continue
+            if name not in items:
+                items[name] = []
+            if section.body is not None:
+                items[name].append(section.body)
         for k in items:
             items[k] = "\n".join(items[k]).strip()
         return items
 
-    def update_screen_info(self, items, screen_info, key_mappings):
+    def update_screen_info(self, items, screen, key_mappings):
         for k in key_mappings:
             if key_mappings[k] in items:
-                screen_info[k] = items[key_mappings[k]]
-        return screen_info
+                setattr(screen, k, items[key_mappings[k]])
+        return screen
+
+    def finish_screen(self, mission, screen):
+        if not screen.needs_answer:
+            screen.no_answer_needed = "True"
+        mission.add_screen(screen)
 
     def parse_notebook(self, data):
         cells = data["cells"]
@@ -418,26 +666,24 @@ class GenerateMissions(BaseCommand):
             print("No metadata for the mission found.  Add this in before generating yaml files.")
             raise InvalidFormatError()
         mission_info = "".join(mission_data["source"])
-        mission_metadata = self.parse_mission_metadata(mission_info)
-        screens = []
-        screen_info = {}
+        mission = Mission.from_dict(self.parse_mission_metadata(mission_info))
+        screen = None
         for i, s in enumerate(screen_data):
             sd = "".join(s["source"])
             if "<!-" in sd:
-                if len(screen_info) > 0:
-                    if self.check_for_no_answer(screen_info):
-                        screen_info["no_answer_needed"] = "True"
-                    screens.append(screen_info)
-                screen_info = self.parse_screen_metadata(sd)
+                if screen is not None:
+                    self.finish_screen(mission, screen)
+                screen_metadata = self.parse_screen_metadata(sd)
+                screen = Screen(screen_metadata.pop("name"), screen_metadata.pop("type"), screen_metadata)
                 screen_names = sd.split("#", 1)[1]
-                screen_names = screen_names.replace(screen_info["name"], "", 1).strip()
+                screen_names = screen_names.replace(screen.name, "", 1).strip()
                 current_item = "left_text"
-                if screen_info["type"] == "video":
+                if screen.type == "video":
                     current_item = "video"
-                elif screen_info["type"] == "text":
+                elif screen.type == "text":
                     current_item = "text"
                 items = self.parse_section(screen_names, current_item)
-                screen_info = self.update_screen_info(items, screen_info, {
+                self.update_screen_info(items, screen, {
                     "left_text": "left_text",
                     "video": "video",
                     "instructions": "instructions",
@@ -445,7 +691,7 @@ class GenerateMissions(BaseCommand):
                     "text": "text"
                 })
             elif s["cell_type"] == "code":
-                if screen_info.get("initial_display") is not None:
+                if screen is None or screen.initial_display is not None:
                     continue
                 # Remove any ipython line magics from the code.
                 code_data = "\n".join([l for l in sd.split("\n") if not l.startswith("%")])
@@ -456,8 +702,8 @@ class GenerateMissions(BaseCommand):
                         items["check val"] = str(items["check val"])
                 except Exception:
                     pass
-                screen_info = self.update_screen_info(items, screen_info, {
-                    "initial_vars": "initial",
+                self.update_screen_info(items, screen, {
+                    "setup": "initial",
                     "initial_display": "display",
                     "answer": "answer",
                     "check_vars": "check vars",
@@ -465,100 +711,322 @@ class GenerateMissions(BaseCommand):
                     "check_code_run": "check code run"
                 })
 
-        if len(screen_info) > 0:
-            if self.check_for_no_answer(screen_info):
-                screen_info["no_answer_needed"] = "True"
-            screens.append(screen_info)
+        if screen is not None:
+            self.finish_screen(mission, screen)
 
-        return mission_metadata, screens
+        return mission, mission.screens
 
-    def generate_yaml(self, mission_metadata, screens):
+    def iter_yaml(self, mission, screens):
+        """
+        Yield the lines of the yaml file for a mission, one at a time.  Each var is
+        the whole setup of the screens that use it, written out from the segments
+        the screens share.
+        """
         separator = "--------"
-        yaml_data = [separator, ""]
-        initial_vars = []
-        code = []
-        for s in screens:
-            if s["type"] != "code":
-                continue
-            if "initial_vars" in s:
-                vars = code + [s["initial_vars"]]
-            else:
-                vars = code
-            ivars = "\n".join(vars)
-            initial_vars.append(ivars)
-            s["full_initial_vars"] = ivars
-            if "initial_vars" in s:
-                code.append(s["initial_vars"])
+        yield separator
+        yield ""
+        prefixes, var_indexes = mission.setup_vars()
 
         for k in ["name", "description", "author", "prerequisites", "language", "premium", "under_construction", "file_list", "mission_number", "mode", "persist_container"]:
-            if k in mission_metadata:
-                yaml_data.append("{0}: {1}".format(k, mission_metadata[k]))
-
-        if len(initial_vars) > 0:
-            yaml_data.append("vars:")
-            for i, v in enumerate(initial_vars):
-                yaml_data.append("  {0}: |".format(i+1))
-                for l in v.split("\n"):
-                    yaml_data.append("    {0}".format(l))
-        yaml_data += ["", separator]
-
+            if k in mission:
+                yield "{0}: {1}".format(k, mission[k])
+
+        if len(prefixes) > 0:
+            yield "vars:"
+            for i, n in enumerate(prefixes):
+                yield "  {0}: |".format(i+1)
+                for l in mission.setup_lines(n):
+                    yield "    {0}".format(l)
+        yield ""
+        yield separator
+
+        var_indexes = iter(var_indexes)
         for s in screens:
-            yaml_data += [""]
+            yield ""
             for k in ["name", "type", "check_vars", "no_answer_needed", "video", "error_okay"]:
                 if k in s:
-                    yaml_data.append("{0}: {1}".format(k, s[k]))
+                    yield "{0}: {1}".format(k, s[k])
             for k in ["left_text", "initial_display", "answer", "hint", "check_val", "check_code_run", "instructions", "text"]:
                 if k in s:
-                    yaml_data.append("{0}: |".format(k))
-                    lines = s[k].split("\n")
-                    for l in lines:
-                        yaml_data.append("  {0}".format(l))
-            if s["type"] == "code":
-                yaml_data.append("initial_vars: {0}".format(initial_vars.index(s["full_initial_vars"]) + 1))
-            yaml_data += ["", separator]
-        full_data = "\n".join(yaml_data)
-        return full_data
+                    yield "{0}: |".format(k)
+                    for l in iter_lines(s[k]):
+                        yield "  {0}".format(l)
+            if s.type == "code":
+                yield "initial_vars: {0}".format(next(var_indexes))
+            yield ""
+            yield separator
+
+    def generate_yaml(self, mission, screens):
+        return "\n".join(self.iter_yaml(mission, screens))
+
+    def write_yaml(self, mission_file, mission, screens):
+        """
+        Stream the yaml for a mission into a temporary file next to mission_file,
+        then move it into place so a failed run never leaves a partial file behind.
+        """
+        with atomic_write(mission_file) as mfile:
+            lines = self.iter_yaml(mission, screens)
+            mfile.write(next(lines))
+            for l in lines:
+                mfile.write("\n")
+                mfile.write(l)
+
+    def load_notebook(self, nb_path, nb_hash=None):
+        """Parse a notebook, going through the parse cache when the hash of the file is known."""
+        cache = get_cache(__version__) if nb_hash is not None else None
+        if cache is not None:
+            parsed = cache.get("notebook", nb_hash)
+            if parsed is not None:
+                return parsed
+        with open(nb_path, "r") as nbfile:
+            data = read_notebook(nbfile)
+        parsed = self.parse_notebook(data)
+        if cache is not None:
+            cache.set("notebook", nb_hash, parsed)
+        return parsed
+
+    def generate_notebook(self, nb_path, path, yaml_path, previous_inputs=None, nb_hash=None):
+        """Write the yaml and data files for one notebook.
+
+        Returns the fingerprints of the data files that were read (relative to the
+        mission folder) and of the files that were written (relative to missions/).
+        When nb_hash is given, the parsed notebook is kept and reused for as long as
+        the hash stays the same.
+        """
+        if previous_inputs is None:
+            previous_inputs = {}
+        parsed = self.parsed_notebooks.get(nb_path)
+        if parsed is not None and nb_hash is not None and parsed[0] == nb_hash:
+            mission, screens = parsed[1]
+        else:
+            with span("generate.parse", file=nb_path):
+                mission, screens = self.load_notebook(nb_path, nb_hash)
+            if nb_hash is not None:
+                self.parsed_notebooks[nb_path] = (nb_hash, (mission, screens))
+        mission_path = os.path.join(yaml_path, str(mission.mission_number))
+        if not os.path.exists(mission_path):
+            os.makedirs(mission_path)
+        mission_file = os.path.join(mission_path, "{0}.yaml".format(mission.mission_number))
+        with span("generate.write_yaml", file=mission_file):
+            self.write_yaml(mission_file, mission, screens)
+        file_list = mission.file_list
+
+        inputs = {}
+        outputs = {os.path.relpath(mission_file, yaml_path): fingerprint(mission_file)}
+        store = AssetStore(os.path.join(path, ASSET_STORE_DIRNAME))
+        for f in file_list:
+            f_path = os.path.join(path, f)
+            dest_path = os.path.join(mission_path, f)
+            with span("generate.stage_asset", file=f_path):
+                inputs[f] = fingerprint(f_path, previous_inputs.get(f))
+                stage_asset(f_path, dest_path, store, inputs[f]["hash"])
+            dest_fingerprint = dict(inputs[f], mtime=os.stat(dest_path).st_mtime)
+            outputs[os.path.relpath(dest_path, yaml_path)] = dest_fingerprint
+        return inputs, outputs
+
+    def list_notebooks(self, path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if os.path.isfile(os.path.join(path, f))]
+        return [f for f in files if f.endswith(".ipynb")]
+
+    def build(self, path, yaml_path, force=False, jobs=1):
+        """Regenerate every notebook in path whose inputs or outputs changed, and return the errors."""
+        nb_files = self.list_notebooks(path)
+        manifest = BuildManifest(path, yaml_path, __version__)
+        nb_names = [os.path.basename(f) for f in nb_files]
+        for nb_name in manifest.prune(nb_names):
+            print("Removed outputs of deleted file {0}".format(nb_name))
+
+        pending = []
+        skipped = 0
+        with span("generate.check_manifest"):
+            for nb_path, nb_name in zip(nb_files, nb_names):
+                nb_fingerprint = manifest.notebook_fingerprint(nb_name)
+                if not force and manifest.is_fresh(nb_name, nb_fingerprint):
+                    manifest.entries[nb_name]["notebook"] = nb_fingerprint
+                    skipped += 1
+                    continue
+                previous_inputs = manifest.entries.get(nb_name, {}).get("inputs")
+                pending.append((nb_path, nb_name, nb_fingerprint, previous_inputs))
+
+        errors = []
+        items = [(nb_path, path, yaml_path, previous_inputs, nb_fingerprint["hash"]) for nb_path, nb_name, nb_fingerprint, previous_inputs in pending]
+        if job_count(jobs, len(items)) == 1:
+            # In this process, so a watching instance keeps its parsed notebooks between builds.
+            results = map_jobs(self.generate_notebook, items, 1, "generate.notebook")
+        else:
+            results = map_jobs(generate_notebook_worker, items, jobs, "generate.notebook", (self.args,))
+        for (nb_path, nb_name, nb_fingerprint, previous_inputs), (item, result, error) in zip(pending, results):
+            print("Processing file at {0}".format(nb_path))
+            if error is not None:
+                errors.append((nb_path, error))
+            else:
+                inputs, outputs = result
+                manifest.record(nb_name, nb_fingerprint, inputs, outputs)
+        with span("generate.save_manifest"):
+            manifest.save()
+            AssetStore(os.path.join(path, ASSET_STORE_DIRNAME)).prune()
 
+        print("Finished writing yaml data to {0}".format(yaml_path))
+        print("Processed {0} notebooks, {1} unchanged, {2} failed.".format(len(nb_files), skipped, len(errors)))
+        for nb_path, e in errors:
+            print("  {0}: {1} {2}".format(nb_path, type(e).__name__, e).rstrip())
+        return errors
+
+    def watched_files(self, path, yaml_path):
+        files = self.list_notebooks(path)
+        manifest = BuildManifest(path, yaml_path, __version__)
+        for entry in manifest.entries.values():
+            files += [os.path.join(path, f) for f in entry["inputs"]]
+        return files
 
     def run(self):
         path = os.path.abspath(os.path.expanduser(self.args.path))
-        files = [os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
-        nb_files = [f for f in files if f.endswith(".ipynb")]
         yaml_path = os.path.join(path, "missions")
         if not os.path.exists(yaml_path):
             os.makedirs(yaml_path)
 
-        for nb_path in nb_files:
-            print("Processing file at {0}".format(nb_path))
-            with open(nb_path, "r") as nbfile:
-                data = json.load(nbfile)
-            mission_metadata, screens = self.parse_notebook(data)
-            yaml_data = self.generate_yaml(mission_metadata, screens)
-            mission_path = os.path.join(yaml_path, mission_metadata["mission_number"])
-            if not os.path.exists(mission_path):
-                os.makedirs(mission_path)
-            mission_file = os.path.join(mission_path, "{0}.yaml".format(mission_metadata["mission_number"]))
-            with open(mission_file, "w+") as mfile:
-                mfile.write(yaml_data)
-            try:
-                file_list = json.loads(mission_metadata["file_list"])
-            except Exception:
-                file_list = ast.literal_eval(mission_metadata["file_list"])
-
-            for f in file_list:
-                f_path = os.path.join(path, f)
-                dest_path = os.path.join(mission_path, f)
-                shutil.copy2(f_path, dest_path)
-        print("Finished writing yaml data to {0}".format(yaml_path))
-
-def get_sources():
-    auth_header = get_auth_header()
-    resp = requests.get(DATAQUEST_MISSION_SOURCE_URL, headers=auth_header)
-    data = json.loads(resp.content.decode("utf-8"))
-    return data
-
-def get_source_selection():
-    sources = get_sources()
+        errors = self.build(path, yaml_path, self.args.force, self.args.jobs)
+        if self.args.watch:
+            from .watch import watch
+            watch(lambda: self.watched_files(path, yaml_path),
+                  lambda changed, removed: self.build(path, yaml_path))
+        elif len(errors) > 0:
+            sys.exit(1)
+
+def generate_notebook_worker(args, nb_path, path, yaml_path, previous_inputs=None, nb_hash=None):
+    """Process a single notebook in a worker process."""
+    command = GenerateMissions(args=args)
+    return command.generate_notebook(nb_path, path, yaml_path, previous_inputs, nb_hash)
+
+class DataquestClient(object):
+    """
+    Shared access to the Dataquest API.
+
+    Holds a single keep-alive session, loads the auth token once, retries
+    connection errors and transient server errors with exponential backoff, and
+    applies REQUEST_TIMEOUT to every request.
+    """
+
+    def __init__(self, timeout=REQUEST_TIMEOUT, retries=REQUEST_RETRIES, backoff_factor=0.5):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.packages.urllib3.util.retry import Retry
+
+        self.timeout = timeout
+        self.token = None
+        self.session = requests.Session()
+        # Only idempotent methods are retried after the server saw the request, so a
+        # test or sync is never submitted twice.  The last 5xx response is returned
+        # rather than raised, so decode_response reports it like any other error.
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=[500, 502, 503, 504],
+                      raise_on_status=False)
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def auth_header(self):
+        if self.token is None:
+            if not os.path.exists(TOKEN_FILE_PATH):
+                print("Please sign in first.")
+                auth = AuthenticateCommand(args=argparse.Namespace())
+                auth.run()
+            with open(TOKEN_FILE_PATH, "r") as tokenfile:
+                data = json.load(tokenfile)
+            self.token = data["token"]
+        return {"Authorization": "Token {0}".format(self.token)}
+
+    def request(self, method, url, authenticate=True, **kwargs):
+        if authenticate:
+            headers = self.auth_header()
+            headers.update(kwargs.pop("headers", {}))
+            kwargs["headers"] = headers
+        kwargs.setdefault("timeout", self.timeout)
+        with span("http." + method.lower(), url=url):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def get_json(self, url, **kwargs):
+        return decode_response(self.get(url, **kwargs))
+
+    def post_json(self, url, **kwargs):
+        return decode_response(self.post(url, **kwargs))
+
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = DataquestClient()
+    return _client
+
+def decode_response(resp):
+    if resp.status_code >= 400:
+        print("The Dataquest API returned an error ({0}) for {1}.".format(resp.status_code, resp.url))
+        raise ServerFailureException()
+    return json.loads(resp.content.decode("utf-8"))
+
+def load_source_cache(token):
+    if not os.path.exists(SOURCE_CACHE_PATH):
+        return None
+    try:
+        with open(SOURCE_CACHE_PATH, "r") as cachefile:
+            cache = json.load(cachefile)
+    except ValueError:
+        return None
+    # The list depends on who is signed in.
+    if cache.get("token") != hashlib.sha1(token.encode("utf-8")).hexdigest():
+        return None
+    return cache
+
+def get_sources(refresh=False, ttl=SOURCE_CACHE_TTL):
+    """
+    Return the mission sources of the signed in user.
+
+    The list is cached in SOURCE_CACHE_PATH and reused for `ttl` seconds.  After that
+    it is revalidated with If-None-Match when the server sent an ETag, and a stale
+    copy is used if the server can't be reached.
+    """
+    import requests
+    client = get_client()
+    client.auth_header()
+    cache = load_source_cache(client.token)
+    if cache is not None and not refresh and time.time() - cache["fetched_at"] < ttl:
+        return cache["sources"]
+
+    headers = {}
+    if cache is not None and cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    try:
+        resp = client.get(DATAQUEST_MISSION_SOURCE_URL, headers=headers)
+        if resp.status_code == 304 and cache is not None:
+            sources = cache["sources"]
+        else:
+            sources = decode_response(resp)
+    except (requests.RequestException, ServerFailureException):
+        if cache is None:
+            raise
+        print("Couldn't reach Dataquest, using the mission sources from {0:.0f} seconds ago.".format(time.time() - cache["fetched_at"]))
+        return cache["sources"]
+
+    write_json_atomic(SOURCE_CACHE_PATH, {
+        "token": hashlib.sha1(client.token.encode("utf-8")).hexdigest(),
+        "fetched_at": time.time(),
+        "etag": resp.headers.get("ETag"),
+        "sources": sources
+    })
+    return sources
+
+def get_source_selection(refresh=False, ttl=SOURCE_CACHE_TTL):
+    sources = get_sources(refresh, ttl)
     print("Your mission sources:")
     for i, source in enumerate(sources):
         print("{0}: {1}".format(i+1, source["path"]))
@@ -569,73 +1037,653 @@ def get_source_selection():
     source = sources[selection]
     return source
 
-def poll_api_endpoint(url):
-    auth_header = get_auth_header()
-    resp = requests.post(url, headers=auth_header)
-    data = json.loads(resp.content.decode("utf-8"))
-    params = {
+class PollTimings(object):
+    """Timings for one task, filled in by poll_api_endpoint."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.submitted = None
+        self.finished = None
+        self.polls = 0
+        self.intervals = []
+
+    def time_to_submit(self):
+        return self.submitted - self.started
+
+    def time_to_result(self):
+        return self.finished - self.started
+
+    def summary(self):
+        return "Got a result after {0:.1f}s and {1} status checks (submitting took {2:.2f}s, longest wait {3:.1f}s).".format(
+            self.time_to_result(), self.polls, self.time_to_submit(), max(self.intervals) if len(self.intervals) > 0 else 0)
+
+def get_poll_hint(resp, status):
+    """Return the number of seconds the server asked us to wait, if it said."""
+    hint = status.get("retry_after", status.get("eta"))
+    if hint is None:
+        hint = resp.headers.get("Retry-After")
+    try:
+        return max(float(hint), 0)
+    except (TypeError, ValueError):
+        return None
+
+def submit_task(url, timings=None):
+    """Start a task on the server and return the params used to check its status."""
+    data = get_client().post_json(url)
+    if timings is not None:
+        timings.submitted = time.time()
+    return {
         "task_type": data["task_type"],
         "task_id": data["task_id"]
     }
-    i = 0
+
+def wait_for_task(params, interval=POLL_INTERVAL, max_interval=POLL_MAX_INTERVAL, deadline=POLL_DEADLINE, timings=None, progress=True):
+    with span("poll.wait", task=params["task_id"]):
+        return _wait_for_task(params, interval, max_interval, deadline, timings, progress)
+
+def _wait_for_task(params, interval, max_interval, deadline, timings, progress):
+    """
+    Wait for a submitted task to finish and return its result.
+
+    Status checks start `interval` seconds apart and back off exponentially up to
+    `max_interval`, unless the status response includes a retry_after/eta hint or a
+    Retry-After header.  Raises ServerFailureException if the task fails or is still
+    running after `deadline` seconds.
+    """
+    if timings is None:
+        timings = PollTimings()
+    if timings.submitted is None:
+        timings.submitted = time.time()
+    client = get_client()
+    give_up_at = timings.submitted + deadline
+    delay = interval
     status = {"state": "PENDING"}
-    while i < 500 and status["state"] == "PENDING":
-        i += 1
-        sys.stdout.write(".")
-        sys.stdout.flush()
-        time.sleep(10)
-        resp = requests.get(DATAQUEST_TASK_STATUS_URL, params=params, headers=auth_header)
-        status = json.loads(resp.content.decode("utf-8"))
+    while status["state"] == "PENDING":
+        remaining = give_up_at - time.time()
+        if remaining <= 0:
+            raise ServerFailureException("Timed out after {0:.0f}s waiting for the server.".format(deadline))
+        delay = min(delay, remaining)
+        if progress:
+            sys.stdout.write(".")
+            sys.stdout.flush()
+        with span("poll.sleep", task=params["task_id"]):
+            time.sleep(delay)
+        timings.intervals.append(delay)
+        timings.polls += 1
+        resp = client.get(DATAQUEST_TASK_STATUS_URL, params=params)
+        status = decode_response(resp)
+        hint = get_poll_hint(resp, status)
+        if hint is not None:
+            delay = max(hint, interval)
+        else:
+            delay = min(delay * POLL_BACKOFF, max_interval)
+    timings.finished = time.time()
     if status["state"] == "FAILURE":
-        print("Error executing your command.")
-        print(status["result"])
-        raise ServerFailureException()
-    elif status["state"] == "SUCCESS":
-        print("..Done.")
+        raise ServerFailureException(status["result"])
     return status["result"]
 
+def poll_api_endpoint(url, interval=POLL_INTERVAL, max_interval=POLL_MAX_INTERVAL, deadline=POLL_DEADLINE, timings=None):
+    """Start a task and wait for it to finish, printing progress as it goes."""
+    if timings is None:
+        timings = PollTimings()
+    params = submit_task(url, timings)
+    try:
+        result = wait_for_task(params, interval, max_interval, deadline, timings)
+    except ServerFailureException as e:
+        print("Error executing your command.")
+        print(e)
+        raise
+    print("..Done.")
+    return result
+
+POLL_ARGUMENTS = [
+    {
+        'flags': ['--poll-interval'],
+        'dest': 'poll_interval',
+        'type': float,
+        'default': POLL_INTERVAL,
+        'help': 'Seconds to wait before the first status check.'
+    },
+    {
+        'flags': ['--poll-max-interval'],
+        'dest': 'poll_max_interval',
+        'type': float,
+        'default': POLL_MAX_INTERVAL,
+        'help': 'The longest wait between status checks.'
+    },
+    {
+        'flags': ['--deadline'],
+        'dest': 'deadline',
+        'type': float,
+        'default': POLL_DEADLINE,
+        'help': 'Seconds to wait for the server before giving up.'
+    },
+    {
+        'flags': ['--timings'],
+        'dest': 'timings',
+        'action': 'store_true',
+        'help': 'Print how long the server took and how often it was polled.'
+    }
+]
+
+SOURCE_ARGUMENTS = POLL_ARGUMENTS + [
+    {
+        'flags': ['--all'],
+        'dest': 'all',
+        'action': 'store_true',
+        'help': 'Run on every mission source without prompting.'
+    },
+    {
+        'flags': ['--source'],
+        'dest': 'source',
+        'nargs': '+',
+        'default': [],
+        'help': 'The ids of the mission sources to run on, without prompting.'
+    },
+    {
+        'flags': ['--concurrency'],
+        'dest': 'concurrency',
+        'type': int,
+        'default': 8,
+        'help': 'How many tasks to wait on at the same time.'
+    },
+    {
+        'flags': ['--refresh'],
+        'dest': 'refresh',
+        'action': 'store_true',
+        'help': 'Fetch the list of mission sources again instead of using the cached copy.'
+    },
+    {
+        'flags': ['--cache-ttl'],
+        'dest': 'cache_ttl',
+        'type': float,
+        'default': SOURCE_CACHE_TTL,
+        'help': 'Seconds to reuse the cached list of mission sources for.'
+    }
+]
+
+def select_sources(args):
+    sources = get_sources(args.refresh, args.cache_ttl)
+    if args.all:
+        return sources
+    by_id = {str(source["id"]): source for source in sources}
+    missing = [i for i in args.source if i not in by_id]
+    if len(missing) > 0:
+        print("Unknown mission source ids: {0}".format(", ".join(missing)))
+        raise UserQuitException()
+    return [by_id[i] for i in args.source]
+
+def run_source_task(args, action, label):
+    source = get_source_selection(args.refresh, args.cache_ttl)
+    url = "{0}{1}/{2}/".format(DATAQUEST_MISSION_SOURCE_URL, source["id"], action)
+    sys.stdout.write(label)
+    timings = PollTimings()
+    result = poll_api_endpoint(url, args.poll_interval, args.poll_max_interval, args.deadline, timings)
+    print("Here's the output.  Make sure to look over this for errors:")
+    print(result["output"])
+    if args.timings:
+        print(timings.summary())
+
+def run_source_tasks(args, action):
+    """
+    Submit a task for every selected source up front, then wait on all of them in a
+    thread pool and print each result as soon as it comes in.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import requests
+
+    def report_failure(source, e):
+        failed.append(source)
+        print("{0} failed:".format(source["path"]))
+        print(e)
+
+    sources = select_sources(args)
+    submitted = []
+    failed = []
+    for source in sources:
+        url = "{0}{1}/{2}/".format(DATAQUEST_MISSION_SOURCE_URL, source["id"], action)
+        timings = PollTimings()
+        # One source the server can't be reached for doesn't stop the others.
+        try:
+            submitted.append((source, submit_task(url, timings), timings))
+        except (ServerFailureException, requests.RequestException) as e:
+            report_failure(source, e)
+        else:
+            print("Started {0} for {1}.".format(action, source["path"]))
+
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as executor:
+        futures = {}
+        for source, params, timings in submitted:
+            future = executor.submit(wait_for_task, params, args.poll_interval, args.poll_max_interval, args.deadline, timings, False)
+            futures[future] = (source, timings)
+        for future in as_completed(futures):
+            source, timings = futures[future]
+            print("")
+            try:
+                result = future.result()
+            except (ServerFailureException, requests.RequestException) as e:
+                report_failure(source, e)
+            else:
+                print("Here's the output for {0}.  Make sure to look over this for errors:".format(source["path"]))
+                print(result["output"])
+            if args.timings and timings.finished is not None:
+                print(timings.summary())
+
+    print("")
+    print("Finished {0} on {1} sources, {2} failed.".format(action, len(sources), len(failed)))
+    if len(failed) > 0:
+        sys.exit(1)
+
+def find_local_missions(paths):
+    """Expand paths into the notebooks, or failing that the mission files, they point to."""
+    missions = []
+    for p in paths:
+        p = os.path.abspath(os.path.expanduser(p))
+        if not os.path.isdir(p):
+            missions.append(p)
+            continue
+        notebooks = sorted(glob.glob(os.path.join(p, "*.ipynb")))
+        if len(notebooks) == 0:
+            yaml_path = os.path.join(p, "missions") if os.path.isdir(os.path.join(p, "missions")) else p
+            notebooks = sorted(glob.glob(os.path.join(yaml_path, "*", "*.yaml")))
+        missions += notebooks
+    return missions
+
+def load_local_mission(path, args):
+    """Load a notebook or mission file into the form runner.run_mission takes."""
+    if path.endswith(".ipynb"):
+        mission, screens = GenerateMissions(args=args).load_notebook(path, hash_file(path))
+    else:
+        mission, screens = mission_loader(path)
+    return {
+        "path": path,
+        "cwd": os.path.dirname(path),
+        "screens": mission.code_screens()
+    }
+
+def run_local_tests(args):
+    """Check missions in a pool of worker processes instead of on the server."""
+
+    paths = find_local_missions(args.local or ["."])
+    failed = 0
+    missions = []
+    for path in paths:
+        try:
+            missions.append(load_local_mission(path, args))
+        except Exception as e:
+            failed += 1
+            print("{0}: {1} {2}".format(path, type(e).__name__, e).rstrip())
+
+    def report(mission, results):
+        errors = [(name, screen_errors) for name, screen_errors in results if len(screen_errors) > 0]
+        print("{0}: {1} of {2} screens passed.".format(mission["path"], len(results) - len(errors), len(results)))
+        for name, screen_errors in errors:
+            for e in screen_errors:
+                print("  {0}: {1}".format(name, e))
+        return len(errors) > 0
+
+    results = map_jobs(run_mission, [(mission, args.screen_timeout) for mission in missions], args.jobs,
+                       "test_local.mission", initializer=warm_worker, initargs=(args.preload,), isolate=True)
+    for (mission, timeout), result, error in results:
+        if error is not None:
+            # A worker that died, or a result that couldn't be sent back, fails only its own mission.
+            failed += 1
+            print("{0}: {1} {2}".format(mission["path"], type(error).__name__, error).rstrip())
+        else:
+            failed += report(mission, result)
+
+    print("Tested {0} missions, {1} failed.".format(len(paths), failed))
+    if failed > 0:
+        sys.exit(1)
+
 class TestMissionCommand(BaseCommand):
     command_name = "test"
+    argument_list = BaseCommand.argument_list + SOURCE_ARGUMENTS + [
+        {
+            'flags': ['--local'],
+            'dest': 'local',
+            'nargs': '*',
+            'metavar': 'PATH',
+            'help': 'Run the missions in these notebooks, mission files or folders (the current folder by default) on this machine instead of on the server.'
+        },
+        jobs_argument("missions run with --local", default=0),
+        {
+            'flags': ['--preload'],
+            'dest': 'preload',
+            'nargs': '*',
+            'default': LOCAL_PRELOAD,
+            'help': 'Modules each --local worker imports before it runs missions.'
+        },
+        {
+            'flags': ['--screen-timeout'],
+            'dest': 'screen_timeout',
+            'type': float,
+            'default': SCREEN_TIMEOUT,
+            'help': 'Seconds any piece of code in a screen can run for with --local.'
+        }
+    ]
 
     def run(self):
-        source = get_source_selection()
-        url = "{0}{1}/test/".format(DATAQUEST_MISSION_SOURCE_URL, source["id"])
-        sys.stdout.write("Testing...")
-        result = poll_api_endpoint(url)
-        print("Here's the output.  Make sure to look over this for errors:")
-        print(result["output"])
+        if self.args.local is not None:
+            run_local_tests(self.args)
+        elif self.args.all or len(self.args.source) > 0:
+            run_source_tasks(self.args, "test")
+        else:
+            run_source_task(self.args, "test", "Testing...")
+
+def blob_status(url):
+    """Return how many bytes of a blob the server has, and whether it has all of it."""
+    resp = get_client().get(url)
+    if resp.status_code == 404:
+        return {"received": 0, "complete": False}
+    return decode_response(resp)
+
+def upload_blob(url, path, size, chunk_size=SYNC_CHUNK_SIZE, retries=REQUEST_RETRIES):
+    """
+    Upload a file to url a chunk at a time.  Each chunk starts where the server
+    says its copy ends, so an upload that was cut off, in this run or an earlier
+    one, carries on from there instead of starting over.
+    """
+    import requests
+    client = get_client()
+    failures = 0
+    status = None
+    with open(path, "rb") as f:
+        while status is None or not status["complete"]:
+            try:
+                if status is None:
+                    status = blob_status(url)
+                    continue
+                start = status["received"]
+                f.seek(start)
+                chunk = f.read(chunk_size)
+                if len(chunk) > 0:
+                    content_range = "bytes {0}-{1}/{2}".format(start, start + len(chunk) - 1, size)
+                else:
+                    content_range = "bytes */{0}".format(size)
+                resp = client.put(url, data=chunk, headers={"Content-Range": content_range, "Content-Type": "application/octet-stream"})
+                # The server's copy doesn't end where we thought, so ask it again.
+                if resp.status_code == 416:
+                    status = None
+                    continue
+                status = decode_response(resp)
+                failures = 0
+            except requests.RequestException as e:
+                failures += 1
+                if failures > retries:
+                    raise
+                print("Uploading {0} was interrupted ({1}), resuming.".format(path, type(e).__name__))
+                status = None
+
+def upload_missing_blobs(source_url, yaml_path, missions, mission_ids, args):
+    """Upload the files of the given missions that the server doesn't have yet."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    needed = blobs(missions, mission_ids)
+    if len(needed) == 0:
+        return
+    data = get_client().post_json(source_url + "blobs/", json={"hashes": sorted(needed)})
+    missing = [h for h in data["missing"] if h in needed]
+    if len(missing) == 0:
+        return
+    size = sum(needed[h][2] for h in missing)
+    print("Uploading {0} of {1} files ({2:.1f} KB).".format(len(missing), len(needed), size / 1024.0))
+
+    def upload(file_hash):
+        mission_id, name, file_size = needed[file_hash]
+        path = os.path.join(yaml_path, mission_id, *name.split("/"))
+        with span("sync.upload", file=path):
+            upload_blob("{0}blobs/{1}/".format(source_url, file_hash), path, file_size, args.chunk_size)
+
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as executor:
+        list(executor.map(upload, missing))
+
+def select_delta_source(args):
+    if args.all or len(args.source) > 1:
+        print("A delta sync goes to one mission source, pick it with --source.")
+        raise UserQuitException()
+    if len(args.source) == 1:
+        return select_sources(args)[0]
+    return get_source_selection(args.refresh, args.cache_ttl)
+
+def run_delta_sync(args):
+    """
+    Sync only the missions that changed since the last sync to the same source.
+
+    The files of the changed missions are uploaded first, leaving out the ones the
+    server already has, and then the server is sent the file hashes of each changed
+    mission and the ids of the removed ones.  If the server's copy doesn't match
+    the last sync, every mission is sent instead, even when nothing changed
+    locally.  The new state is only recorded once the server has finished.
+    """
+    yaml_path = os.path.abspath(os.path.expanduser(args.delta))
+    if os.path.isdir(os.path.join(yaml_path, "missions")):
+        yaml_path = os.path.join(yaml_path, "missions")
+    if not os.path.isdir(yaml_path):
+        print("There is no missions folder at {0}, run generate first.".format(yaml_path))
+        sys.exit(1)
+    source = select_delta_source(args)
+    source_url = "{0}{1}/".format(DATAQUEST_MISSION_SOURCE_URL, source["id"])
+    state = SyncState(yaml_path, source_url, __version__)
+    with span("sync.scan", path=yaml_path):
+        missions = state.scan()
+
+    client = get_client()
+    base = None if args.full else state.hash
+    mismatch = "The server's copy of {0} doesn't match the last sync, sending every mission.".format(source["path"])
+    while True:
+        if base is None:
+            changed, removed = sorted(missions), []
+        else:
+            changed, removed = state.diff(missions)
+            if len(changed) == 0 and len(removed) == 0:
+                # The source may have been synced some other way since.
+                if client.get_json(source_url + "delta_sync/").get("state") == base:
+                    print("Nothing changed since the last sync.")
+                    return
+                print(mismatch)
+                base = None
+                continue
+        upload_missing_blobs(source_url, yaml_path, missions, changed, args)
+        timings = PollTimings()
+        resp = client.post(source_url + "delta_sync/", json=delta_payload(missions, changed, removed, base))
+        if resp.status_code == 409 and base is not None:
+            print(mismatch)
+            base = None
+            continue
+        data = decode_response(resp)
+        timings.submitted = time.time()
+        break
+
+    if base is None:
+        sys.stdout.write("Syncing all {0} missions...".format(len(changed)))
+    else:
+        sys.stdout.write("Syncing {0} changed and {1} removed missions...".format(len(changed), len(removed)))
+    params = {"task_type": data["task_type"], "task_id": data["task_id"]}
+    try:
+        result = wait_for_task(params, args.poll_interval, args.poll_max_interval, args.deadline, timings)
+    except ServerFailureException as e:
+        print("Error executing your command.")
+        print(e)
+        raise
+    print("..Done.")
+    state.save(missions)
+    print("Here's the output.  Make sure to look over this for errors:")
+    print(result["output"])
+    if args.timings:
+        print(timings.summary())
 
 class SyncMissionCommand(BaseCommand):
     command_name = "sync"
+    argument_list = BaseCommand.argument_list + SOURCE_ARGUMENTS + [
+        {
+            'flags': ['--delta'],
+            'dest': 'delta',
+            'nargs': '?',
+            'const': '.',
+            'help': 'Send only the missions that changed since the last sync, from the missions folder at this path.'
+        },
+        {
+            'flags': ['--full'],
+            'dest': 'full',
+            'action': 'store_true',
+            'help': 'With --delta, send every mission even if it hasn\'t changed.'
+        },
+        {
+            'flags': ['--chunk-size'],
+            'dest': 'chunk_size',
+            'type': int,
+            'default': SYNC_CHUNK_SIZE,
+            'help': 'Bytes to send in each request when uploading files.'
+        }
+    ]
 
     def run(self):
-        source = get_source_selection()
-        url = "{0}{1}/sync/".format(DATAQUEST_MISSION_SOURCE_URL, source["id"])
-        sys.stdout.write("Syncing...")
-        result = poll_api_endpoint(url)
-        print("Here's the output.  Make sure to look over this for errors:")
-        print(result["output"])
+        if self.args.delta is not None:
+            run_delta_sync(self.args)
+        elif self.args.all or len(self.args.source) > 0:
+            run_source_tasks(self.args, "sync")
+        else:
+            run_source_task(self.args, "sync", "Syncing...")
+
+def validate_file(path, args):
+    """
+    Run the static checks on a notebook or mission file.  Screens are checked
+    through the cache, so only the ones that changed since the last run are.
+    """
+    import contextlib
+    import io
+    cache = get_cache(__version__)
+    issues = []
+    try:
+        if path.endswith(".ipynb"):
+            with open(path, "r") as nbfile:
+                nb = read_notebook(nbfile)
+            issues += check_notebook(nb)
+            if any(i["severity"] == "error" for i in issues):
+                return {"issues": issues, "file_list": []}
+            # parse_notebook prints its errors as well as raising them.
+            with contextlib.redirect_stdout(io.StringIO()):
+                mission, screens = GenerateMissions(args=args).parse_notebook(nb)
+        else:
+            mission, screens = mission_loader(path)
+    except Exception as e:
+        issues.append({"severity": "error", "message": "Couldn't parse the mission: {0} {1}".format(type(e).__name__, e).rstrip()})
+        return {"issues": issues, "file_list": []}
+
+    mission_issues, file_list = check_mission_meta(mission)
+    issues += mission_issues
+    for i, screen in enumerate(screens):
+        key = screen_hash(screen.as_dict())
+        screen_issues = cache.get(VALIDATE_SCREEN_CACHE_KIND, key) if cache is not None else None
+        if screen_issues is None:
+            screen_issues = check_screen(screen)
+            if cache is not None:
+                cache.set(VALIDATE_SCREEN_CACHE_KIND, key, screen_issues)
+        for issue in screen_issues:
+            issues.append(dict(issue, screen=i + 1, name=screen.name))
+    return {"issues": issues, "file_list": file_list}
+
+def validate_file_worker(args, path):
+    """Validate a single file in a worker process."""
+    return validate_file(path, args)
+
+class ValidateCommand(BaseCommand):
+    command_name = "validate"
+    argument_list = BaseCommand.argument_list + [
+        {
+            'dest': 'paths',
+            'type': str,
+            'nargs': '*',
+            'help': 'The notebooks, mission files or folders to check.  Defaults to the current folder.'
+        },
+        jobs_argument("changed files"),
+        {
+            'flags': ['--format'],
+            'dest': 'format',
+            'choices': ['text', 'json'],
+            'default': 'text',
+            'help': 'Print the issues as text, or as json for other tools.'
+        }
+    ]
+
+    def verdicts(self, paths):
+        """
+        Yield the path and static verdict of every file.  Files are looked up in the
+        cache by their hash, and only the ones that changed are checked, in a process
+        pool when there are several.
+        """
+        cache = get_cache(__version__)
+        pending = []
+        for path in paths:
+            try:
+                previous = cache.get("fingerprint", path) if cache is not None else None
+                file_fingerprint = fingerprint(path, previous)
+            except OSError as e:
+                yield path, {"issues": [{"severity": "error", "message": str(e)}], "file_list": []}
+                continue
+            if cache is not None and file_fingerprint != previous:
+                cache.set("fingerprint", path, file_fingerprint)
+            verdict = cache.get(VALIDATE_CACHE_KIND, file_fingerprint["hash"]) if cache is not None else None
+            if verdict is not None:
+                yield path, verdict
+            else:
+                pending.append((path, file_fingerprint["hash"]))
+
+        results = map_jobs(validate_file_worker, [(path,) for path, file_hash in pending], self.args.jobs, "validate.file", (self.args,))
+        for (path, file_hash), (item, verdict, error) in zip(pending, results):
+            if error is not None:
+                raise error
+            if cache is not None:
+                cache.set(VALIDATE_CACHE_KIND, file_hash, verdict)
+            yield path, verdict
+
+    def run(self):
+        paths = find_local_missions(self.args.paths or ["."])
+        files = []
+        for path, verdict in self.verdicts(paths):
+            issues = list(verdict["issues"])
+            # Data files can change without the mission changing, so they are never cached.
+            for f in verdict["file_list"]:
+                if not os.path.exists(os.path.join(os.path.dirname(path), f)):
+                    issues.append({"severity": "error", "message": "file_list has {0!r}, which doesn't exist.".format(f)})
+            files.append({"path": path, "issues": issues})
+
+        errors = sum(1 for f in files for i in f["issues"] if i["severity"] == "error")
+        warnings = sum(1 for f in files for i in f["issues"] if i["severity"] == "warning")
+        if self.args.format == "json":
+            print(json.dumps({"files": files, "errors": errors, "warnings": warnings}, indent=1, sort_keys=True))
+        else:
+            for f in files:
+                for i in f["issues"]:
+                    where = ""
+                    if "screen" in i:
+                        where = "screen {0} ({1}): ".format(i["screen"], i["name"])
+                    print("{0}: {1}{2}: {3}".format(f["path"], where, i["severity"], i["message"]))
+            print("Validated {0} files, {1} errors, {2} warnings.".format(len(files), errors, warnings))
+        if errors > 0:
+            sys.exit(1)
 
 def get_command_classes():
     return {cls.command_name: cls for cls in BaseCommand.__subclasses__()}
 
 def get_auth_header():
-    if not os.path.exists(TOKEN_FILE_PATH):
-        print("Please sign in first.")
-        auth = AuthenticateCommand()
-        auth.run()
-    with open(TOKEN_FILE_PATH, "r") as tokenfile:
-        data = json.load(tokenfile)
-    return {"Authorization": "Token {0}".format(data["token"])}
+    return get_client().auth_header()
 
 def main():
     parser = argparse.ArgumentParser(description='Run helper commands for dataquest.')
     parser.add_argument(dest='command', type=str, help='The command to run.')
     parser.add_argument(dest='options', help='Additional options.', nargs="*")
+    parser.add_argument('--profile', dest='profile')
 
-    args = parser.parse_args()
+    args, _ = parser.parse_known_args()
     command = args.command
     commands = get_command_classes()
     cls = commands[command]
-    inst = cls()
-    inst.run()
\ No newline at end of file
+    start_profiling(args.profile)
+    try:
+        inst = cls()
+        with span("command." + command):
+            inst.run()
+    finally:
+        stop_profiling()
\ No newline at end of file
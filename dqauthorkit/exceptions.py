@@ -0,0 +1,31 @@
+class NoAuthenticationError(Exception):
+    pass
+
+class InvalidPythonError(Exception):
+    pass
+
+class InvalidFormatError(Exception):
+    pass
+
+class MetadataError(InvalidFormatError):
+    """A <!-- key=value --> metadata comment that couldn't be parsed."""
+
+    def __init__(self, message, text=None, position=None):
+        super(MetadataError, self).__init__(message)
+        self.message = message
+        self.text = text
+        self.position = position
+
+    def __str__(self):
+        if self.text is None or self.position is None:
+            return self.message
+        return "{0} (at column {1} of {2!r})".format(self.message, self.position + 1, self.text)
+
+class UserQuitException(Exception):
+    pass
+
+class ServerFailureException(Exception):
+    pass
+
+class ScreenTimeoutError(Exception):
+    pass
@@ -0,0 +1,60 @@
+"""
+Running the same work over many files, in worker processes when -j/--jobs asks for them.
+"""
+import os
+
+from .profiling import span
+
+
+def jobs_argument(what, default=1):
+    """The -j/--jobs argument every command that can run in parallel takes."""
+    return {
+        'flags': ['-j', '--jobs'],
+        'dest': 'jobs',
+        'type': int,
+        'default': default,
+        'help': 'The number of {0} to process in parallel, or 0 for one per CPU.'.format(what)
+    }
+
+
+def job_count(jobs, count):
+    """How many worker processes to start for count items, where jobs 0 means one per CPU."""
+    if not jobs or jobs < 0:
+        jobs = os.cpu_count() or 1
+    return max(min(jobs, count), 1)
+
+
+def capture(fn, *args):
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
+
+
+def map_jobs(fn, items, jobs=1, name="job", shared=(), initializer=None, initargs=(), isolate=False):
+    """
+    Yield (item, result, error) for each tuple in items, in order, where result is
+    fn(*shared, *item) and error is the exception it raised, if any.  Each call is
+    timed as a span called name.
+
+    With more than one job, or with isolate, fn runs in a pool of worker
+    processes, so it and its arguments have to be picklable.  Otherwise it runs
+    in this process, after initializer, as each result is asked for.
+    """
+    items = list(items)
+    jobs = job_count(jobs, len(items))
+    if jobs > 1 or (isolate and len(items) > 0):
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as executor:
+            futures = [executor.submit(fn, *(shared + item)) for item in items]
+            for item, future in zip(items, futures):
+                with span(name, item=item[0]):
+                    result, error = capture(future.result)
+                yield item, result, error
+    else:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            with span(name, item=item[0]):
+                result, error = capture(fn, *(shared + item))
+            yield item, result, error
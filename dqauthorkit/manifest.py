@@ -0,0 +1,158 @@
+import contextlib
+import hashlib
+import json
+import os
+
+MANIFEST_FILENAME = ".dqauthor-manifest.json"
+# Bump whenever generate writes different files for the same notebook, so the
+# outputs recorded by older manifests are written again.
+OUTPUT_FORMAT = 2
+
+
+def hash_file(path, block_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint(path, previous=None):
+    """Return the size, mtime and hash of a file.
+
+    The hash from `previous` is reused when the size and mtime still match, so
+    unchanged data files don't need to be read again.
+    """
+    st = os.stat(path)
+    if previous is not None and previous.get("size") == st.st_size and previous.get("mtime") == st.st_mtime:
+        file_hash = previous["hash"]
+    else:
+        file_hash = hash_file(path)
+    return {"hash": file_hash, "size": st.st_size, "mtime": st.st_mtime}
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path next to path to write to.  It is moved over path when
+    the block finishes, so readers never see half a file, and removed if the
+    block raises.  If the block leaves nothing there, path is left as it was.
+    """
+    tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        yield tmp_path
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w", encoding=None, newline=None):
+    """
+    Open a temporary file to write path through, see atomic_path.  Setting
+    f.discard = True in the block leaves path as it was.
+    """
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, encoding=encoding, newline=newline) as f:
+            f.discard = False
+            yield f
+        if f.discard:
+            os.remove(tmp_path)
+
+
+def write_json_atomic(path, data):
+    with atomic_write(path) as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+
+class BuildManifest(object):
+    """Tracks which notebooks produced which files under missions/.
+
+    Entries are keyed by notebook filename and hold fingerprints of the notebook
+    itself, the data files it references (relative to the mission folder) and the
+    files it wrote (relative to missions/).  Manifests from another version of
+    dqauthorkit or another OUTPUT_FORMAT are ignored.
+    """
+
+    def __init__(self, root_path, yaml_path, version):
+        self.root_path = root_path
+        self.yaml_path = yaml_path
+        self.version = version
+        self.path = os.path.join(yaml_path, MANIFEST_FILENAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            if data.get("version") == self.version and data.get("format") == OUTPUT_FORMAT:
+                self.entries = data.get("notebooks", {})
+
+    def notebook_fingerprint(self, nb_name):
+        entry = self.entries.get(nb_name, {})
+        return fingerprint(os.path.join(self.root_path, nb_name), entry.get("notebook"))
+
+    def _matches(self, base_path, files):
+        for name, previous in files.items():
+            full_path = os.path.join(base_path, name)
+            if not os.path.isfile(full_path):
+                return False
+            if fingerprint(full_path, previous)["hash"] != previous["hash"]:
+                return False
+        return True
+
+    def is_fresh(self, nb_name, nb_fingerprint):
+        entry = self.entries.get(nb_name)
+        if entry is None or entry["notebook"]["hash"] != nb_fingerprint["hash"]:
+            return False
+        return self._matches(self.root_path, entry["inputs"]) and self._matches(self.yaml_path, entry["outputs"])
+
+    def owned_outputs(self, exclude=None):
+        owned = set()
+        for nb_name, entry in self.entries.items():
+            if nb_name != exclude:
+                owned.update(entry["outputs"])
+        return owned
+
+    def _remove_outputs(self, outputs):
+        owned = self.owned_outputs()
+        for name in outputs:
+            if name in owned:
+                continue
+            full_path = os.path.join(self.yaml_path, name)
+            if os.path.isfile(full_path):
+                os.remove(full_path)
+            parent = os.path.dirname(full_path)
+            while parent != self.yaml_path and os.path.isdir(parent) and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+
+    def record(self, nb_name, nb_fingerprint, inputs, outputs):
+        old_entry = self.entries.get(nb_name)
+        self.entries[nb_name] = {
+            "notebook": nb_fingerprint,
+            "inputs": inputs,
+            "outputs": outputs
+        }
+        if old_entry is not None:
+            self._remove_outputs([o for o in old_entry["outputs"] if o not in outputs])
+
+    def prune(self, nb_names):
+        """Remove entries and outputs for notebooks that no longer exist."""
+        removed = []
+        for nb_name in sorted(self.entries):
+            if nb_name not in nb_names:
+                entry = self.entries.pop(nb_name)
+                self._remove_outputs(entry["outputs"])
+                removed.append(nb_name)
+        return removed
+
+    def save(self):
+        write_json_atomic(self.path, {
+            "version": self.version,
+            "format": OUTPUT_FORMAT,
+            "notebooks": self.entries
+        })
@@ -0,0 +1,182 @@
+"""
+The missions and screens that parsers build and every converter reads.
+
+A Mission is built once, from a notebook or a mission file, and the yaml and
+notebook writers, validate and test --local all work from it instead of
+re-deriving the same facts from the text.
+
+Both classes can also be read like the dicts they replace, with screen["answer"],
+screen.get("error_okay") or "hint" in screen, where a field that is None counts
+as missing and other keys fall through to the metadata.
+
+They are pickled into the parse cache, so bump cache.CACHE_FORMAT when they change.
+"""
+import ast
+import json
+
+from .parsing import iter_lines
+
+
+class FieldMapping(object):
+    __slots__ = ()
+    # Dict keys that are stored under another field name.
+    aliases = {}
+
+    def field(self, key):
+        key = self.aliases.get(key, key)
+        if key in self.__slots__ and key != "metadata":
+            return key
+        return None
+
+    def __getitem__(self, key):
+        field = self.field(key)
+        if field is None:
+            return self.metadata[key]
+        value = getattr(self, field)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        field = self.field(key)
+        if field is None:
+            self.metadata[key] = value
+        else:
+            setattr(self, field, value)
+
+    def __contains__(self, key):
+        field = self.field(key)
+        if field is None:
+            return key in self.metadata
+        return getattr(self, field) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [k for k in self.key_order if getattr(self, k) is not None]
+        return keys + list(self.metadata)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def as_dict(self):
+        return dict((k, self[k]) for k in self.keys())
+
+
+class Screen(FieldMapping):
+    """
+    A screen of a mission.  setup is the code the screen adds to the setup of the
+    code screens before it, and the whole setup is a prefix of the segments list
+    the screen shares with the rest of its mission.
+    """
+    __slots__ = ("name", "type", "left_text", "instructions", "hint", "video", "text",
+                 "initial_display", "answer", "check_vars", "check_val", "check_code_run",
+                 "no_answer_needed", "setup", "metadata", "segments", "setup_end")
+    aliases = {"initial_vars": "setup"}
+    key_order = ("name", "type", "check_vars", "no_answer_needed", "video", "left_text", "initial_display",
+                 "answer", "hint", "check_val", "check_code_run", "instructions", "text", "setup")
+
+    def __init__(self, name=None, type=None, metadata=None):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        self.name = name
+        self.type = type
+        self.metadata = metadata if metadata is not None else {}
+        self.setup_end = 0
+
+    @property
+    def needs_answer(self):
+        """Whether the screen has an answer, instructions and something to check the answer with."""
+        if self.answer is None or self.instructions is None:
+            return False
+        return self.check_vars is not None or self.check_val is not None or self.check_code_run is not None
+
+    @property
+    def initial(self):
+        """All of the setup code the screen starts from."""
+        if self.segments is None:
+            return self.setup
+        return "\n".join(self.segments[:self.setup_end])
+
+    def __repr__(self):
+        return "Screen({0!r}, {1!r})".format(self.name, self.type)
+
+
+class Mission(FieldMapping):
+    """A mission, with its screens and the setup code segments they share."""
+    __slots__ = ("name", "description", "author", "imports", "metadata", "screens", "segments")
+    key_order = ("name", "description", "author", "imports")
+
+    def __init__(self, name=None, description=None, author=None, metadata=None):
+        self.name = name
+        self.description = description
+        self.author = author
+        self.imports = None
+        self.metadata = metadata if metadata is not None else {}
+        self.screens = []
+        self.segments = []
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data.pop("vars", None)
+        mission = cls(data.pop("name", None), data.pop("description", None), data.pop("author", None), data)
+        mission.imports = data.pop("imports", None)
+        return mission
+
+    @property
+    def mission_number(self):
+        return self.metadata.get("mission_number")
+
+    @property
+    def file_list(self):
+        file_list = self.metadata.get("file_list", [])
+        if isinstance(file_list, str):
+            try:
+                file_list = json.loads(file_list)
+            except ValueError:
+                file_list = ast.literal_eval(file_list)
+        return file_list
+
+    def add_screen(self, screen):
+        """Add a screen, appending the setup it adds to the shared segments."""
+        if screen.type == "code":
+            # An empty ## Initial section adds nothing, so it doesn't start a new var.
+            if screen.setup is not None and len(screen.setup.strip()) > 0:
+                self.segments.append(screen.setup)
+            screen.segments = self.segments
+            screen.setup_end = len(self.segments)
+        self.screens.append(screen)
+        return screen
+
+    def code_screens(self):
+        return [s for s in self.screens if s.type == "code"]
+
+    def setup_vars(self):
+        """
+        Return how many segments each distinct setup is made of, and the (1-based)
+        index of the setup of every code screen.  Screens that add nothing to the
+        setup before them share its index.
+        """
+        prefixes = []
+        indexes = []
+        for screen in self.code_screens():
+            if len(prefixes) == 0 or prefixes[-1] != screen.setup_end:
+                prefixes.append(screen.setup_end)
+            indexes.append(len(prefixes))
+        return prefixes, indexes
+
+    def setup_lines(self, n):
+        """Yield the lines of the first n segments without joining them together."""
+        if n == 0:
+            yield ""
+        for segment in self.segments[:n]:
+            for l in iter_lines(segment):
+                yield l
+
+    def __repr__(self):
+        return "Mission({0!r}, {1} screens)".format(self.name, len(self.screens))
@@ -1,4 +1,4 @@
 c = get_config()
 
 c.Exporter.template_file = 'new_markdown'
-c.Exporter.preprocessors = ['preprocessor.HTMLPreprocessor']
+c.Exporter.preprocessors = ['dqauthorkit.nbconvert_html.preprocessor.HTMLPreprocessor']
@@ -1,6 +1,8 @@
 from IPython.nbconvert.preprocessors import *
-from collections import namedtuple
-import re
+
+from ..parsing import split_sections, strip_metadata
+
+CHECK_SECTIONS = ["check vars", "check val", "check code run"]
 
 class HTMLPreprocessor(Preprocessor):
 
@@ -8,7 +10,7 @@ class HTMLPreprocessor(Preprocessor):
         """
         Adds bold 'cheese' to the start of every markdown cell.
         """
-        cell.source = re.sub("<!-.+->", "", cell.source)
+        cell.source = strip_metadata(cell.source)
         cell.source = cell.source.strip()
         if 'source' in cell:
             if index == 0:
@@ -16,21 +18,25 @@ class HTMLPreprocessor(Preprocessor):
                 cell.source = lines[0]
                 print("Lesson Name: {0}".format(lines[0]))
             else:
+                sections = split_sections(cell.source)
                 if cell.cell_type == "markdown":
-                    cell.source = cell.source.split("## Instructions")[0]
+                    for section in sections:
+                        if section.name == "instructions":
+                            cell.source = cell.source[:section.offset]
+                            break
                     if cell.source.startswith("#"):
                         cell.source = "#" + cell.source
                 else:
-                    data = cell.source.split("## Display")
-                    if len(data) == 1:
-                        cell.source = data[0]
-                    else:
-                        data = data[1]
-                        data = data.replace("## Answer", "")
-                        for item in ["## Check vars", "## Check val", "## Check code run"]:
-                            regex = re.compile(re.escape(item), re.IGNORECASE)
-                            data = regex.split(data)[0]
-                        cell.source = data
+                    # Show the display code and the answer, and leave out the setup and checks.
+                    names = [section.name for section in sections]
+                    if "display" in names:
+                        data = []
+                        for section in sections[names.index("display"):]:
+                            if section.name in CHECK_SECTIONS:
+                                break
+                            if section.body is not None and len(section.body.strip()) > 0:
+                                data.append(section.body.strip())
+                        cell.source = "\n\n".join(data)
             cell.source = cell.source.strip()
             # cell.source = re.sub("\\n+", "\\n", cell.source)
-        return cell, resources
\ No newline at end of file
+        return cell, resources
@@ -0,0 +1,387 @@
+"""
+Reading and writing notebook json without going through IPython.
+"""
+import json
+import re
+
+from .manifest import atomic_write
+
+NBFORMAT = 4
+NBFORMAT_MINOR = 0
+KERNELSPEC = {
+    "display_name": "Python 3",
+    "language": "python",
+    "name": "python3"
+}
+
+
+def split_source(text):
+    """Split text into lines that keep their newlines, the way nbformat stores sources."""
+    return text.splitlines(True)
+
+
+def new_markdown_cell(source):
+    return {
+        "cell_type": "markdown",
+        "metadata": {},
+        "source": split_source(source)
+    }
+
+
+def new_code_cell(source):
+    return {
+        "cell_type": "code",
+        "execution_count": None,
+        "metadata": {},
+        "outputs": [],
+        "source": split_source(source)
+    }
+
+
+def new_notebook(cells):
+    return {
+        "cells": cells,
+        "metadata": {
+            "kernelspec": dict(KERNELSPEC),
+            "language_info": {"name": "python"}
+        },
+        "nbformat": NBFORMAT,
+        "nbformat_minor": NBFORMAT_MINOR
+    }
+
+
+def dumps_notebook(nb):
+    """
+    Serialize a notebook the way nbformat does.  Keys are sorted, so the same
+    notebook always comes out as the same bytes.
+    """
+    return json.dumps(nb, sort_keys=True, indent=1, ensure_ascii=False) + "\n"
+
+
+def write_notebook(path, nb):
+    """Write nb to path through a temporary file, so readers never see half a notebook."""
+    with atomic_write(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(dumps_notebook(nb))
+
+
+CHUNK_SIZE = 64 * 1024
+# Cell values that parsing notebooks never looks at, and that hold all the big output data.
+SKIPPED_CELL_KEYS = ("outputs", "attachments")
+# What strip_output replaces each cell value with.
+STRIPPED_CELL_VALUES = {"outputs": "[]", "prompt_number": "null"}
+
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+STRING_BODY_RE = re.compile(r'(?:[^"\\]+|\\.)*', re.S)
+STRUCTURE_RE = re.compile(r'[^"\[\]{}]*')
+SCALAR_RE = re.compile(r'[^\s,:\[\]{}"]*')
+EMPTY_VALUE_RE = re.compile(r"\[[ \t\n\r]*\]|null")
+
+
+class JSONScanner(object):
+    """
+    Walks a json document that is read from a file a chunk at a time.
+
+    Values can be decoded, or skipped without ever being decoded or held in
+    memory as a whole.  When out is given, the document can also be copied to it
+    as it is scanned, with some values replaced or members removed, and
+    everything else left byte for byte as it was.
+    """
+
+    def __init__(self, f, out=None, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.out = out
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        # Offset in the document of buf[0], and of the first character not yet copied to out or dropped.
+        self.offset = 0
+        self.emitted = 0
+        self.eof = False
+        # What happens to scanned text when more is read: "copy" it to out, "drop" it, or keep it (None).
+        self.release = None
+        # Where the member remove_member() last left out started, and whether it was the first of its object.
+        self.removed_start = None
+        self.member_first_removed = False
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def error(self, message):
+        return ValueError("{0} at offset {1} of the notebook.".format(message, self.tell()))
+
+    def fill(self):
+        """Read the next chunk, discarding the text that is no longer needed."""
+        if self.eof:
+            return False
+        if self.out is None or self.release == "drop":
+            self.emitted = self.tell()
+        elif self.release == "copy":
+            self.flush(self.tell())
+        cut = self.emitted - self.offset
+        if cut > 0:
+            self.buf = self.buf[cut:]
+            self.pos -= cut
+            self.offset += cut
+        chunk = self.f.read(self.chunk_size)
+        if len(chunk) == 0:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def ensure(self, n):
+        while len(self.buf) - self.pos < n and self.fill():
+            pass
+        return len(self.buf) - self.pos >= n
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.buf):
+            raise self.error("Unexpected end")
+        return self.buf[self.pos]
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise self.error("Expected {0!r}".format(c))
+        self.pos += 1
+
+    def read_value(self):
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise self.error("Invalid value")
+                # Read ahead as much again as is buffered, so long values aren't decoded over and over.
+                self.ensure(2 * (len(self.buf) - self.pos) + 1)
+                continue
+            # A number that runs to the end of the buffer may go on in the next chunk.
+            if isinstance(value, (int, float)) and SCALAR_RE.match(self.buf, self.pos).end() == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip_string(self):
+        self.pos += 1
+        while True:
+            self.pos = STRING_BODY_RE.match(self.buf, self.pos).end()
+            if self.pos >= len(self.buf):
+                if not self.fill():
+                    raise self.error("Unterminated string")
+                continue
+            if self.buf[self.pos] == '"':
+                self.pos += 1
+                return
+            # A backslash at the end of the buffer, escaping the first character of the next chunk.
+            if not self.ensure(2):
+                raise self.error("Unterminated string")
+
+    def skip_scalar(self):
+        start = self.tell()
+        while True:
+            self.pos = SCALAR_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                break
+        if self.tell() == start:
+            raise self.error("Invalid value")
+
+    def skip_value(self, release=None):
+        """Move past the value at the current position without decoding it."""
+        previous = self.release
+        self.release = release
+        try:
+            depth = 0
+            while True:
+                if depth > 0:
+                    self.pos = STRUCTURE_RE.match(self.buf, self.pos).end()
+                    if self.pos >= len(self.buf):
+                        if not self.fill():
+                            raise self.error("Unexpected end")
+                        continue
+                    c = self.buf[self.pos]
+                else:
+                    c = self.peek()
+                if c == '"':
+                    self.skip_string()
+                elif c in "[{":
+                    depth += 1
+                    self.pos += 1
+                elif c in "]}" and depth > 0:
+                    depth -= 1
+                    self.pos += 1
+                elif depth == 0:
+                    self.skip_scalar()
+                else:
+                    raise self.error("Unexpected {0!r}".format(c))
+                if depth == 0:
+                    return
+        finally:
+            self.release = previous
+
+    def members(self):
+        """Yield the keys of the object at the current position.  The caller has to consume each value."""
+        self.expect("{")
+        first = True
+        while True:
+            start = self.tell()
+            if self.peek() == "}":
+                self.pos += 1
+                return
+            if not first:
+                self.expect(",")
+            else:
+                start = self.tell()
+            key = self.read_value()
+            if not isinstance(key, str):
+                raise self.error("Expected a key")
+            self.expect(":")
+            self.member_start = start
+            self.member_first = first
+            first = False
+            yield key
+            # Removing the first member takes the comma after it too, so the next one is first now.
+            if self.removed_start == start:
+                first = self.member_first_removed
+
+    def items(self):
+        """Yield once for each item of the array at the current position.  The caller has to consume each item."""
+        self.expect("[")
+        first = True
+        while True:
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            if not first:
+                self.expect(",")
+            first = False
+            yield
+
+    def flush(self, upto):
+        if self.out is not None:
+            self.out.write(self.buf[self.emitted - self.offset:upto - self.offset])
+        self.emitted = upto
+
+    def clear_value(self, empty):
+        """Replace the value at the current position with empty.  Returns False if it was empty already."""
+        self.skip_whitespace()
+        self.ensure(64)
+        if EMPTY_VALUE_RE.match(self.buf, self.pos):
+            self.skip_value("copy")
+            return False
+        self.flush(self.tell())
+        self.out.write(empty)
+        self.skip_value("drop")
+        self.emitted = self.tell()
+        return True
+
+    def remove_member(self):
+        """Leave the member whose key was just yielded by members() out of the copy."""
+        self.flush(self.member_start)
+        self.skip_value("drop")
+        if self.member_first and self.peek() == ",":
+            self.pos += 1
+            self.skip_whitespace()
+        self.emitted = self.tell()
+        self.removed_start = self.member_start
+        self.member_first_removed = self.member_first
+
+    def finish(self):
+        """Copy the rest of the document."""
+        self.release = "copy"
+        self.pos = len(self.buf)
+        while self.fill():
+            self.pos = len(self.buf)
+        self.flush(self.tell())
+
+
+def read_cell(scanner, skip):
+    cell = {}
+    for key in scanner.members():
+        if key in skip:
+            scanner.skip_value()
+        else:
+            cell[key] = scanner.read_value()
+    return cell
+
+
+def iter_notebook(f, skip=SKIPPED_CELL_KEYS):
+    """
+    Yield the top level keys of a notebook and their values, reading f as it
+    goes.  Each cell is yielded on its own under "cells" (the cells of nbformat 3
+    worksheets included), and the cell values named in skip are never read.
+    """
+    scanner = JSONScanner(f)
+    for key in scanner.members():
+        if key == "cells":
+            for _ in scanner.items():
+                yield "cells", read_cell(scanner, skip)
+        elif key == "worksheets":
+            for _ in scanner.items():
+                for worksheet_key in scanner.members():
+                    if worksheet_key == "cells":
+                        for _ in scanner.items():
+                            yield "cells", read_cell(scanner, skip)
+                    else:
+                        scanner.skip_value()
+        else:
+            yield key, scanner.read_value()
+
+
+def read_notebook(f, skip=SKIPPED_CELL_KEYS):
+    """Read a notebook without the cell values named in skip."""
+    nb = {"cells": []}
+    for key, value in iter_notebook(f, skip):
+        if key == "cells":
+            nb["cells"].append(value)
+        else:
+            nb[key] = value
+    return nb
+
+
+def strip_cells(scanner):
+    changed = False
+    for _ in scanner.items():
+        for key in scanner.members():
+            if key in STRIPPED_CELL_VALUES:
+                changed = scanner.clear_value(STRIPPED_CELL_VALUES[key]) or changed
+            else:
+                scanner.skip_value("copy")
+    return changed
+
+
+def strip_notebook(infile, outfile):
+    """
+    Copy a notebook from infile to outfile without its outputs, prompt numbers
+    and signature, a chunk at a time.  Returns whether anything was stripped.
+    """
+    scanner = JSONScanner(infile, outfile)
+    changed = False
+    for key in scanner.members():
+        if key == "cells":
+            changed = strip_cells(scanner) or changed
+        elif key == "worksheets":
+            for _ in scanner.items():
+                for worksheet_key in scanner.members():
+                    if worksheet_key == "cells":
+                        changed = strip_cells(scanner) or changed
+                    else:
+                        scanner.skip_value("copy")
+        elif key == "metadata":
+            for metadata_key in scanner.members():
+                if metadata_key == "signature":
+                    scanner.remove_member()
+                    changed = True
+                else:
+                    scanner.skip_value("copy")
+        else:
+            scanner.skip_value("copy")
+    scanner.finish()
+    return changed
@@ -0,0 +1,144 @@
+import json
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from .exceptions import MetadataError
+
+SECTION_HEADER_RE = re.compile(r"^##.*$", re.M)
+HASHES_RE = re.compile("#{1,}")
+
+# name is the normalized header ("check val" for "## Check Val"), or None for the
+# text before the first header.  offset is where the header line starts, and body
+# is the text up to the next header, or None if the section has no lines at all.
+Section = namedtuple("Section", ["name", "offset", "body"])
+
+
+def iter_lines(text):
+    """Yield the lines of text, like text.split("\\n") without building the list."""
+    start = 0
+    end = text.find("\n")
+    while end != -1:
+        yield text[start:end]
+        start = end + 1
+        end = text.find("\n", start)
+    yield text[start:]
+
+
+def section_name(header):
+    return HASHES_RE.sub("", header.strip().lower()).strip()
+
+
+@lru_cache(maxsize=512)
+def split_sections(text):
+    """
+    Split text at every line that starts with ## in a single scan.
+
+    Results are cached, since the same cell text is split by both the yaml
+    generator and the blog post preprocessor.
+    """
+    sections = []
+    name = None
+    offset = 0
+    start = 0
+    for match in SECTION_HEADER_RE.finditer(text):
+        body = text[start:match.start() - 1] if match.start() > start else None
+        sections.append(Section(name, offset, body))
+        name = section_name(match.group(0))
+        offset = match.start()
+        start = match.end() + 1
+    body = text[start:] if start <= len(text) else None
+    sections.append(Section(name, offset, body))
+    return tuple(sections)
+
+
+METADATA_START_RE = re.compile(r"<!-+")
+METADATA_TOKEN_RE = re.compile(r"""
+    \s*
+    (?:
+        (?P<end>-+>)
+      | (?P<key>[^\s="'<>]+) \s*=\s*
+        (?:
+            "(?P<double>(?:[^"\\]|\\.)*)"
+          | '(?P<single>(?:[^'\\]|\\.)*)'
+          | (?P<list>\[[^\]]*\]|\{[^}]*\})
+          | (?P<bare>(?!["'])[^\n]*?)(?=\s+[^\s="'<>]+\s*=|\s*-+>|[ \t\r]*(?:\n|$))
+        )
+    )
+    """, re.X | re.S)
+ESCAPE_RE = re.compile(r"\\([\\\"'])")
+
+
+def scan_metadata(text, start=0, require_end=False):
+    """
+    Parse the first <!-- key=value ... --> comment in text at or after start.
+
+    Returns the values and the span of the comment.  Values can be double or
+    single quoted (with backslash escapes), bracketed lists, or bare words, which
+    run up to the next key= (or the end of the line) like they always have.  Everything stays a string.
+    A comment without a closing --> runs to the end of text unless require_end is set.
+    """
+    match = METADATA_START_RE.search(text, start)
+    if match is None:
+        raise MetadataError("Missing metadata string at top of mission/screen.", text, start)
+    comment_start = match.start()
+    pos = match.end()
+    values = {}
+    closed = False
+    while pos < len(text):
+        token = METADATA_TOKEN_RE.match(text, pos)
+        if token is None:
+            if len(text[pos:].strip()) == 0:
+                pos = len(text)
+                break
+            raise MetadataError("Expected key=value in metadata.", text, pos)
+        pos = token.end()
+        if token.group("end") is not None:
+            closed = True
+            break
+        if token.group("double") is not None:
+            value = ESCAPE_RE.sub(r"\1", token.group("double"))
+        elif token.group("single") is not None:
+            value = ESCAPE_RE.sub(r"\1", token.group("single"))
+        elif token.group("list") is not None:
+            value = token.group("list")
+        else:
+            value = token.group("bare")
+        values[token.group("key")] = value
+    if require_end and not closed:
+        raise MetadataError("Metadata comment isn't closed with -->.", text, comment_start)
+    return values, comment_start, pos
+
+
+def parse_metadata(text):
+    return scan_metadata(text)[0]
+
+
+def strip_metadata(text):
+    """Remove every metadata comment from text."""
+    parts = []
+    pos = 0
+    while True:
+        match = METADATA_START_RE.search(text, pos)
+        if match is None:
+            break
+        try:
+            values, start, end = scan_metadata(text, match.start(), require_end=True)
+        except MetadataError:
+            # Not a metadata comment, so leave it alone.
+            parts.append(text[pos:match.end()])
+            pos = match.end()
+            continue
+        parts.append(text[pos:start])
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def quote_metadata_value(value):
+    """Format a value for a metadata comment so that parse_metadata reads it back."""
+    if isinstance(value, str):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
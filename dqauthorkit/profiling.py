@@ -0,0 +1,147 @@
+"""
+Timing spans for finding out where a command spends its time.
+
+Profiling is off unless `--profile` or the DQAUTHOR_TRACE environment variable is
+set to a comma separated list of outputs:
+
+    summary            print a table of time per stage to stderr
+    chrome:trace.json  write a trace that chrome://tracing and Perfetto can open
+    cprofile:out.prof  run the command under cProfile and dump the stats
+
+When it is off, span() returns a shared no-op context manager.  Work done in
+worker processes (--jobs) shows up as the time the parent waited on it.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+TRACE_ENV = "DQAUTHOR_TRACE"
+
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.events.append((self.name, self.start, time.perf_counter() - self.start,
+                                   threading.current_thread().ident, self.args))
+        return False
+
+
+class Tracer(object):
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.events = []
+        self.origin = time.perf_counter()
+        self.profiler = None
+        for kind, path in outputs:
+            if kind == "cprofile":
+                import cProfile
+                self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        for kind, path in self.outputs:
+            if kind == "summary":
+                self.print_summary()
+            elif kind == "chrome":
+                self.write_chrome_trace(path)
+            elif kind == "cprofile":
+                self.profiler.dump_stats(path)
+                sys.stderr.write("Wrote cProfile stats to {0}\n".format(path))
+
+    def print_summary(self, out=sys.stderr):
+        stages = {}
+        for name, start, duration, tid, args in self.events:
+            count, total, longest = stages.get(name, (0, 0.0, 0.0))
+            stages[name] = (count + 1, total + duration, max(longest, duration))
+        out.write("{0:<36} {1:>7} {2:>11} {3:>11} {4:>11}\n".format("stage", "calls", "total (s)", "mean (ms)", "max (ms)"))
+        for name, (count, total, longest) in sorted(stages.items(), key=lambda item: -item[1][1]):
+            out.write("{0:<36} {1:>7} {2:>11.3f} {3:>11.2f} {4:>11.2f}\n".format(
+                name, count, total, total * 1000 / count, longest * 1000))
+
+    def write_chrome_trace(self, path):
+        pid = os.getpid()
+        events = []
+        for name, start, duration, tid, args in self.events:
+            events.append({
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": duration * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": dict((k, str(v)) for k, v in args.items())
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        sys.stderr.write("Wrote trace to {0}\n".format(path))
+
+
+_tracer = None
+
+
+def span(name, **args):
+    """Time the enclosed block as a stage called name."""
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def parse_outputs(spec):
+    outputs = []
+    for item in spec.split(","):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+        kind, _, path = item.partition(":")
+        if kind not in ("summary", "chrome", "cprofile"):
+            raise ValueError("Unknown profile output {0!r}, use summary, chrome:<file> or cprofile:<file>.".format(item))
+        if kind != "summary" and len(path) == 0:
+            path = {"chrome": "dqauthor-trace.json", "cprofile": "dqauthor.prof"}[kind]
+        outputs.append((kind, path))
+    return outputs
+
+
+def start_profiling(spec=None):
+    """Turn profiling on for spec, or for DQAUTHOR_TRACE if spec isn't given."""
+    global _tracer
+    if spec is None:
+        spec = os.environ.get(TRACE_ENV)
+    if not spec:
+        return None
+    _tracer = Tracer(parse_outputs(spec))
+    _tracer.start()
+    return _tracer
+
+
+def stop_profiling():
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    if tracer is not None:
+        tracer.stop()
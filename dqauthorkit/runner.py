@@ -0,0 +1,179 @@
+"""
+Running the code screens of a mission on this machine, to check them without
+the server.
+
+Each mission runs in one namespace.  The setup a screen adds to the screens
+before it is run once, on top of what is already there, and every screen's
+display code, answer and checks run on a snapshot of that namespace, so they
+can't change what later screens start from.
+"""
+import ast
+import contextlib
+import copy
+import importlib
+import io
+import os
+import signal
+import traceback
+
+from .exceptions import ScreenTimeoutError
+
+# Imported by every worker before it is given a mission, when they are installed.
+LOCAL_PRELOAD = ["numpy", "pandas", "matplotlib.pyplot"]
+SCREEN_TIMEOUT = 30
+
+
+def warm_worker(preload=LOCAL_PRELOAD):
+    """Import the modules missions usually need, so the first screen doesn't pay for them."""
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def snapshot(namespace):
+    """
+    Copy a namespace.  Values are deep copied together, so names that shared an
+    object still do, and values that can't be copied (modules, open files) are shared.
+    """
+    copied = {}
+    memo = {}
+    for k, v in namespace.items():
+        try:
+            copied[k] = copy.deepcopy(v, memo)
+        except Exception:
+            copied[k] = v
+    return copied
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    if not seconds or not hasattr(signal, "setitimer"):
+        yield
+        return
+
+    def expired(signum, frame):
+        raise ScreenTimeoutError("Took longer than {0} seconds.".format(seconds))
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def run_code(code, namespace, filename, timeout=SCREEN_TIMEOUT):
+    """Run code in namespace and return what it printed."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        with time_limit(timeout):
+            exec(compile(code, filename, "exec"), namespace)
+    return out.getvalue()
+
+
+def describe_error(e, filename):
+    if isinstance(e, SyntaxError):
+        return "line {0}: SyntaxError: {1}".format(e.lineno, e.msg)
+    if isinstance(e, ScreenTimeoutError):
+        return str(e)
+    message = "".join(traceback.format_exception_only(type(e), e)).strip()
+    lines = [frame.lineno for frame in traceback.extract_tb(e.__traceback__) if frame.filename == filename]
+    if len(lines) > 0:
+        message = "line {0}: {1}".format(lines[-1], message)
+    return message
+
+
+def parse_check_vars(check_vars):
+    if isinstance(check_vars, str):
+        check_vars = ast.literal_eval(check_vars)
+    if not isinstance(check_vars, (list, tuple)):
+        raise ValueError("check_vars should be a list of names, not {0!r}.".format(check_vars))
+    return [str(v) for v in check_vars]
+
+
+def check_screen(screen, namespace, timeout=SCREEN_TIMEOUT):
+    """Run the display code, answer and checks of a screen, and return what went wrong."""
+    errors = []
+    # error_okay lets code raise, but not hang.
+    error_okay = str(screen.get("error_okay")) == "True"
+    label = screen.get("name", "screen")
+
+    display = screen.get("initial_display")
+    if display:
+        filename = "<{0}: display>".format(label)
+        try:
+            run_code(display, snapshot(namespace), filename, timeout)
+        except (Exception, SystemExit) as e:
+            if not error_okay or isinstance(e, ScreenTimeoutError):
+                errors.append("The display code fails, {0}".format(describe_error(e, filename)))
+
+    answer = screen.get("answer")
+    if not answer or str(screen.get("no_answer_needed")) == "True":
+        return errors
+
+    state = snapshot(namespace)
+    filename = "<{0}: answer>".format(label)
+    try:
+        output = run_code(answer, state, filename, timeout)
+    except (Exception, SystemExit) as e:
+        if not error_okay or isinstance(e, ScreenTimeoutError):
+            errors.append("The answer fails, {0}".format(describe_error(e, filename)))
+        return errors
+
+    if screen.get("check_vars"):
+        try:
+            check_vars = parse_check_vars(screen["check_vars"])
+        except (ValueError, SyntaxError) as e:
+            errors.append(str(e))
+        else:
+            for name in check_vars:
+                if name not in state:
+                    errors.append("check_vars has {0!r}, which the answer doesn't define.".format(name))
+
+    if screen.get("check_val") is not None and len(str(screen["check_val"]).strip()) > 0:
+        expected = str(screen["check_val"]).strip()
+        if output.strip() != expected:
+            errors.append("The answer prints {0!r}, but check_val is {1!r}.".format(output.strip(), expected))
+
+    if screen.get("check_code_run"):
+        filename = "<{0}: check_code_run>".format(label)
+        try:
+            run_code(screen["check_code_run"], state, filename, timeout)
+        except (Exception, SystemExit) as e:
+            errors.append("check_code_run fails, {0}".format(describe_error(e, filename)))
+    return errors
+
+
+def run_mission(mission, timeout=SCREEN_TIMEOUT):
+    """
+    Check every code screen of a mission.  mission has the folder its data files are
+    in as "cwd", and its code screens as "screens", each with the setup it adds to
+    the screens before it as "setup".  Returns a list of (screen name, errors).
+    """
+    results = []
+    namespace = {"__name__": "__main__"}
+    setup_failed = False
+    cwd = os.getcwd()
+    os.chdir(mission["cwd"])
+    try:
+        for i, screen in enumerate(mission["screens"]):
+            label = screen.get("name", "screen {0}".format(i + 1))
+            if setup_failed:
+                results.append((label, ["Not run, since the setup of an earlier screen fails."]))
+                continue
+            if screen.get("setup"):
+                filename = "<{0}: initial>".format(label)
+                try:
+                    run_code(screen["setup"], namespace, filename, timeout)
+                except (Exception, SystemExit) as e:
+                    setup_failed = True
+                    results.append((label, ["The setup fails, {0}".format(describe_error(e, filename))]))
+                    continue
+            results.append((label, check_screen(screen, namespace, timeout)))
+    finally:
+        os.chdir(cwd)
+    return results
@@ -0,0 +1,127 @@
+"""
+The local side of delta syncs.
+
+The generated missions/ folder is hashed one mission at a time, and compared
+with the state of the folder at the last sync that went through, so only the
+missions that changed since then need to be sent.  Files are sent as blobs
+named by their hash, so the server only ever receives contents it doesn't
+already have.
+"""
+import hashlib
+import json
+import os
+
+from .manifest import fingerprint, write_json_atomic
+
+SYNC_STATE_FILENAME = ".dqauthor-sync.json"
+
+
+def mission_hash(files):
+    """Hash a mission from the names and hashes of its files."""
+    h = hashlib.sha1()
+    for name in sorted(files):
+        h.update("{0} {1}\n".format(name, files[name]["hash"]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def state_hash(missions):
+    """Hash a whole tree from the hashes of its missions."""
+    text = json.dumps(dict((k, v["hash"]) for k, v in missions.items()), sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def scan_missions(yaml_path, previous=None):
+    """
+    Return {mission id: {"hash", "files"}} for every mission folder under
+    yaml_path, where files has a fingerprint for each file in the folder.  Hashes
+    from previous are reused for files whose size and mtime haven't changed.
+    """
+    previous = previous or {}
+    missions = {}
+    for mission_id in sorted(os.listdir(yaml_path)):
+        mission_path = os.path.join(yaml_path, mission_id)
+        if mission_id.startswith(".") or not os.path.isdir(mission_path):
+            continue
+        old_files = previous.get(mission_id, {}).get("files", {})
+        files = {}
+        for root, dirs, names in os.walk(mission_path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(names):
+                if name.startswith("."):
+                    continue
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, mission_path).replace(os.sep, "/")
+                files[rel_path] = fingerprint(full_path, old_files.get(rel_path))
+        if len(files) > 0:
+            missions[mission_id] = {"hash": mission_hash(files), "files": files}
+    return missions
+
+
+class SyncState(object):
+    """
+    What the missions/ folder looked like at the last sync to a mission source.
+
+    It is kept next to the missions in SYNC_STATE_FILENAME, and forgotten when
+    syncing to a different source or server, or after a different version wrote it.
+    """
+
+    def __init__(self, yaml_path, target, version):
+        self.yaml_path = yaml_path
+        self.target = target
+        self.version = version
+        self.path = os.path.join(yaml_path, SYNC_STATE_FILENAME)
+        self.missions = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            if data.get("version") == self.version and data.get("target") == self.target:
+                self.missions = data.get("missions", {})
+
+    @property
+    def hash(self):
+        """The hash of the last synced tree, or None if there wasn't one."""
+        if len(self.missions) == 0:
+            return None
+        return state_hash(self.missions)
+
+    def scan(self):
+        return scan_missions(self.yaml_path, self.missions)
+
+    def diff(self, current):
+        """Return the ids of the missions that changed or are new, and the ones that were removed."""
+        changed = [k for k in sorted(current) if self.missions.get(k, {}).get("hash") != current[k]["hash"]]
+        removed = [k for k in sorted(self.missions) if k not in current]
+        return changed, removed
+
+    def save(self, current):
+        self.missions = current
+        write_json_atomic(self.path, {
+            "version": self.version,
+            "target": self.target,
+            "missions": current
+        })
+
+
+def blobs(missions, mission_ids):
+    """Return {hash: (mission id, file name, size)} for the files of the given missions."""
+    found = {}
+    for mission_id in mission_ids:
+        for name, file_fingerprint in missions[mission_id]["files"].items():
+            found.setdefault(file_fingerprint["hash"], (mission_id, name, file_fingerprint["size"]))
+    return found
+
+
+def delta_payload(missions, changed, removed, base):
+    """The body of a delta sync request: the file hashes of each changed mission."""
+    return {
+        "base": base,
+        "state": state_hash(missions),
+        "missions": dict((k, {
+            "hash": missions[k]["hash"],
+            "files": dict((name, f["hash"]) for name, f in missions[k]["files"].items())
+        }) for k in changed),
+        "removed": removed
+    }
@@ -0,0 +1,166 @@
+"""
+Static checks for missions, which the validate command runs without executing
+any of their code.
+
+Each check returns a list of issues, dicts with a "severity" of "error" or
+"warning" and a "message".  The checks of a screen only depend on the screen,
+so their results can be cached by its contents.
+"""
+import ast
+import hashlib
+import json
+
+from .exceptions import MetadataError
+from .parsing import parse_metadata
+
+# Bump when the checks change, so cached verdicts from older checks aren't used.
+RULES_VERSION = 2
+CACHE_KIND = "validate-{0}".format(RULES_VERSION)
+SCREEN_CACHE_KIND = "validate-screen-{0}".format(RULES_VERSION)
+SCREEN_TYPES = ["code", "video", "text"]
+# Methods of lists, dicts and sets that change the object they are called on.
+MUTATING_METHODS = set([
+    "append", "extend", "insert", "pop", "popitem", "remove", "clear", "update", "setdefault",
+    "add", "discard", "sort", "reverse", "difference_update", "intersection_update",
+    "symmetric_difference_update"
+])
+
+
+def error(message):
+    return {"severity": "error", "message": message}
+
+
+def warning(message):
+    return {"severity": "warning", "message": message}
+
+
+def screen_hash(screen):
+    text = json.dumps(screen, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def assigned_names(tree):
+    """
+    The names code could bind or change: assignment targets, imports, function
+    and class names, and the objects of item and attribute updates and of calls
+    to MUTATING_METHODS or with inplace=True.
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name is not None:
+            names.add(node.name)
+        elif isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(node.ctx, ast.Store):
+            target = node.value
+            while isinstance(target, (ast.Subscript, ast.Attribute)):
+                target = target.value
+            if isinstance(target, ast.Name):
+                names.add(target.id)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
+            inplace = any(k.arg == "inplace" and isinstance(k.value, ast.Constant) and k.value.value is True for k in node.keywords)
+            if node.func.attr in MUTATING_METHODS or inplace:
+                names.add(node.func.value.id)
+    return names
+
+
+def parse_name_list(value):
+    if isinstance(value, str):
+        value = ast.literal_eval(value)
+    if not isinstance(value, (list, tuple)) or not all(isinstance(v, str) for v in value):
+        raise ValueError
+    return list(value)
+
+
+def check_screen(screen):
+    """Check a parsed screen, with the setup code it adds to the screens before it as "setup"."""
+    issues = []
+    screen_type = screen.get("type")
+    if screen_type is None:
+        return [error("The screen has no type.")]
+    if screen_type not in SCREEN_TYPES:
+        return [error("Unknown screen type {0!r}.".format(screen_type))]
+    if screen_type != "code":
+        return issues
+
+    trees = {}
+    for key, label in [("setup", "setup code"), ("answer", "answer"), ("check_code_run", "check_code_run")]:
+        if screen.get(key) is None:
+            continue
+        try:
+            trees[key] = ast.parse(str(screen[key]))
+        except SyntaxError as e:
+            issues.append(error("The {0} isn't valid python, line {1}: {2}.".format(label, e.lineno, e.msg)))
+
+    if screen.get("check_vars"):
+        try:
+            check_vars = parse_name_list(screen["check_vars"])
+        except (ValueError, SyntaxError):
+            issues.append(error("check_vars should be a list of names, not {0!r}.".format(screen["check_vars"])))
+        else:
+            if "answer" in trees:
+                names = assigned_names(trees["answer"])
+                for name in check_vars:
+                    if name not in names:
+                        issues.append(error("check_vars has {0!r}, which the answer never assigns.".format(name)))
+            elif screen.get("answer") is None:
+                issues.append(warning("The screen has check_vars but no answer."))
+    return issues
+
+
+def check_mission_meta(meta):
+    """Check the metadata of a mission.  Returns the issues and the file_list."""
+    issues = []
+    for key in ["mission_number", "name"]:
+        if key not in meta:
+            issues.append(error("The mission has no {0}.".format(key)))
+    file_list = meta.get("file_list", [])
+    if isinstance(file_list, str):
+        try:
+            file_list = json.loads(file_list)
+        except ValueError:
+            try:
+                file_list = ast.literal_eval(file_list)
+            except (ValueError, SyntaxError):
+                file_list = None
+    try:
+        file_list = parse_name_list(file_list)
+    except ValueError:
+        issues.append(error("file_list should be a list of file names, not {0!r}.".format(meta.get("file_list"))))
+        file_list = []
+    return issues, file_list
+
+
+def check_notebook(nb):
+    """Check the cells of a notebook before it is parsed, since parsing stops at the first problem."""
+    issues = []
+    kernel = nb.get("metadata", {}).get("kernelspec", {}).get("name")
+    if kernel != "python3":
+        issues.append(error("The notebook's kernel is {0!r}, but Dataquest requires python3.".format(kernel)))
+    cells = nb.get("cells", [])
+    if len(cells) == 0 or cells[0].get("cell_type") != "markdown" or "<!-" not in "".join(cells[0].get("source", "")):
+        issues.append(error("The first cell needs to be markdown with the mission's <!-- --> metadata."))
+    for i, cell in enumerate(cells):
+        if cell.get("cell_type") != "markdown":
+            continue
+        source = "".join(cell.get("source", ""))
+        if "<!-" not in source:
+            if i + 1 < len(cells) and cells[i + 1].get("cell_type") == "code":
+                issues.append(error("Cell {0} has no <!-- --> metadata, so the code after it isn't part of a new screen.".format(i + 1)))
+            elif i > 0:
+                issues.append(warning("Cell {0} has no <!-- --> metadata, so it is left out of the mission.".format(i + 1)))
+            continue
+        try:
+            metadata = parse_metadata(source)
+        except MetadataError as e:
+            issues.append(error("Cell {0} has invalid metadata: {1}".format(i + 1, e)))
+            continue
+        if i > 0 and "type" not in metadata:
+            issues.append(error("Cell {0} has no screen type in its metadata.".format(i + 1)))
+        if "#" not in source:
+            issues.append(error("Cell {0} has no # title.".format(i + 1)))
+    return issues
@@ -0,0 +1,66 @@
+import os
+import time
+
+WATCH_INTERVAL = 0.5
+WATCH_DEBOUNCE = 0.3
+
+
+def snapshot(paths):
+    state = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        state[path] = (st.st_mtime, st.st_size)
+    return state
+
+
+class PollingWatcher(object):
+    """
+    Watch a set of files by polling their mtimes and sizes, so it works anywhere
+    without native file system event libraries.
+
+    list_files is called on every poll, so files that appear later are picked up.
+    Bursts of writes (like Jupyter autosaving) are collapsed into one change by
+    waiting until nothing has changed for `debounce` seconds.
+    """
+
+    def __init__(self, list_files, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+        self.list_files = list_files
+        self.interval = interval
+        self.debounce = debounce
+        self.state = snapshot(list_files())
+
+    def wait(self):
+        """Block until something changes, and return the changed and removed paths."""
+        current = self.state
+        while current == self.state:
+            time.sleep(self.interval)
+            current = snapshot(self.list_files())
+        while True:
+            time.sleep(self.debounce)
+            latest = snapshot(self.list_files())
+            if latest == current:
+                break
+            current = latest
+        changed = sorted(p for p in current if self.state.get(p) != current[p])
+        removed = sorted(p for p in self.state if p not in current)
+        self.state = current
+        return changed, removed
+
+
+def watch(list_files, rebuild, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+    """Call rebuild(changed, removed) every time the watched files change, until interrupted."""
+    watcher = PollingWatcher(list_files, interval, debounce)
+    print("Watching for changes.  Press Ctrl-C to stop.")
+    try:
+        while True:
+            changed, removed = watcher.wait()
+            for path in changed:
+                print("Changed: {0}".format(path))
+            for path in removed:
+                print("Removed: {0}".format(path))
+            rebuild(changed, removed)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
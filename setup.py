@@ -13,7 +13,8 @@ with open("README.md", "rb") as f:
 
 setup(
     name="dqauthorkit",
-    packages=["dqauthorkit"],
+    packages=["dqauthorkit", "dqauthorkit.nbconvert_html"],
+    package_data={"dqauthorkit.nbconvert_html": ["*.tpl"]},
     entry_points={
         "console_scripts": ['dqauthor = dqauthorkit.dqauthorkit:main']
     },
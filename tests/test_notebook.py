@@ -0,0 +1,36 @@
+import io
+import json
+import unittest
+
+from dqauthorkit.notebook import read_notebook, strip_notebook
+
+
+def strip(text):
+    out = io.StringIO()
+    changed = strip_notebook(io.StringIO(text), out)
+    return changed, out.getvalue()
+
+
+class StripSignatureTest(unittest.TestCase):
+    def check(self, metadata, expected):
+        text = json.dumps({"cells": [], "metadata": metadata, "nbformat": 4})
+        changed, stripped = strip(text)
+        self.assertTrue(changed)
+        self.assertEqual(json.loads(stripped)["metadata"], expected)
+        self.assertEqual(read_notebook(io.StringIO(stripped))["metadata"], expected)
+
+    def test_first(self):
+        self.check({"signature": "x", "b": 1, "c": 2}, {"b": 1, "c": 2})
+
+    def test_middle(self):
+        self.check({"a": 1, "signature": "x", "b": 1}, {"a": 1, "b": 1})
+
+    def test_last(self):
+        self.check({"a": 1, "signature": "x"}, {"a": 1})
+
+    def test_only(self):
+        self.check({"signature": "x"}, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+"""
+A stand-in for the parts of the Dataquest API that dqauthor talks to, for
+developing and testing syncs without a real server.
+
+    python tools/sync_server.py --port 8000 --data-dir /tmp/dq-server
+    DATAQUEST_BASE_URL=http://127.0.0.1:8000/api/v1/ dqauthor sync --delta . --source 1
+
+Any email and password sign in.  Uploaded blobs and the synced state of each
+source are kept in --data-dir, so the server can be restarted between syncs.
+--drop-every makes it cut off every nth upload request halfway through a chunk,
+to exercise resuming, and --forget starts over from an empty --data-dir.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+SOURCES_RE = re.compile(r"/missions/mission_sources/$")
+TASK_RE = re.compile(r"/missions/mission_sources/(\w+)/(sync|test)/$")
+BLOBS_RE = re.compile(r"/missions/mission_sources/(\w+)/blobs/$")
+BLOB_RE = re.compile(r"/missions/mission_sources/(\w+)/blobs/([0-9a-f]{40})/$")
+DELTA_RE = re.compile(r"/missions/mission_sources/(\w+)/delta_sync/$")
+CONTENT_RANGE_RE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+)$")
+
+
+class Store(object):
+    """Blobs, which are named by their sha1, and the missions each source was last synced with."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(path, "blobs"), exist_ok=True)
+        self.state_path = os.path.join(path, "sources.json")
+        self.sources = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                self.sources = json.load(f)
+
+    def blob_path(self, blob_hash, partial=False):
+        return os.path.join(self.path, "blobs", blob_hash + (".part" if partial else ""))
+
+    def has_blob(self, blob_hash):
+        return os.path.exists(self.blob_path(blob_hash))
+
+    def blob_status(self, blob_hash):
+        if self.has_blob(blob_hash):
+            return {"received": os.path.getsize(self.blob_path(blob_hash)), "complete": True}
+        partial = self.blob_path(blob_hash, True)
+        if os.path.exists(partial):
+            return {"received": os.path.getsize(partial), "complete": False}
+        return None
+
+    def finish_blob(self, blob_hash):
+        """Keep a blob once all of it is in, if it hashes to its name."""
+        partial = self.blob_path(blob_hash, True)
+        h = hashlib.sha1()
+        with open(partial, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        if h.hexdigest() != blob_hash:
+            os.remove(partial)
+            return False
+        os.replace(partial, self.blob_path(blob_hash))
+        return True
+
+    def save(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.sources, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "dqauthor-stand-in/1"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            sys.stderr.write("{0} {1}\n".format(self.command, format % args))
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def read_json(self):
+        body = self.read_body()
+        if len(body) == 0:
+            return {}
+        return json.loads(body.decode("utf-8"))
+
+    def new_task(self, task_type, output):
+        task_id = str(next(self.server.task_ids))
+        self.server.tasks[task_id] = (time.time() + self.server.task_seconds, output)
+        self.send_json(200, {"task_type": task_type, "task_id": task_id})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        store = self.server.store
+        if SOURCES_RE.search(path):
+            return self.send_json(200, [{"id": i, "path": "stand-in/source-{0}".format(i)} for i in range(1, self.server.source_count + 1)])
+        if path.endswith("/missions/task_status/"):
+            task_id = parse_qs(urlparse(self.path).query).get("task_id", [""])[0]
+            if task_id not in self.server.tasks:
+                return self.send_json(404, {"detail": "No such task."})
+            done_at, output = self.server.tasks[task_id]
+            if time.time() < done_at:
+                return self.send_json(200, {"state": "PENDING", "retry_after": done_at - time.time()})
+            return self.send_json(200, {"state": "SUCCESS", "result": {"output": output}})
+        match = BLOB_RE.search(path)
+        if match is not None:
+            with store.lock:
+                status = store.blob_status(match.group(2))
+            if status is None:
+                return self.send_json(404, {"detail": "No such blob."})
+            return self.send_json(200, status)
+        match = DELTA_RE.search(path)
+        if match is not None:
+            # What the source was last delta synced with, so clients can tell it still is.
+            with store.lock:
+                current = store.sources.get(match.group(1))
+            return self.send_json(200, {"state": current["state"] if current is not None else None})
+        self.send_json(404, {"detail": "Not found."})
+
+    def do_PUT(self):
+        path = urlparse(self.path).path
+        store = self.server.store
+        match = BLOB_RE.search(path)
+        if match is None:
+            self.read_body()
+            return self.send_json(404, {"detail": "Not found."})
+        blob_hash = match.group(2)
+        content_range = CONTENT_RANGE_RE.match(self.headers.get("Content-Range", ""))
+        if content_range is None:
+            self.read_body()
+            return self.send_json(400, {"detail": "Uploads need a Content-Range."})
+        length = int(self.headers.get("Content-Length") or 0)
+        start = int(content_range.group(1) or 0)
+        total = int(content_range.group(3))
+
+        self.server.put_count += 1
+        # Keep only the first half of every nth chunk, and hang up without answering.
+        dropped = self.server.drop_every > 0 and self.server.put_count % self.server.drop_every == 0 and length > 1
+        chunk = self.rfile.read(length // 2 if dropped else length)
+
+        with store.lock:
+            status = store.blob_status(blob_hash) or {"received": 0, "complete": False}
+            if status["complete"]:
+                return self.send_json(200, status)
+            received = status["received"]
+            # Chunks may overlap what the server has when a request is retried.
+            if start > received:
+                return self.send_json(416, status)
+            with open(store.blob_path(blob_hash, True), "ab") as f:
+                f.write(chunk[received - start:])
+            received = max(received, start + len(chunk))
+            if dropped:
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            if received >= total:
+                if not store.finish_blob(blob_hash):
+                    return self.send_json(400, {"detail": "The blob doesn't match its hash."})
+                return self.send_json(200, {"received": total, "complete": True})
+        self.send_json(200, {"received": received, "complete": False})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        store = self.server.store
+        if path.endswith("/accounts/get_auth_token/"):
+            self.read_body()
+            return self.send_json(200, {"token": "stand-in-token"})
+        match = TASK_RE.search(path)
+        if match is not None:
+            self.read_body()
+            source_id, action = match.groups()
+            if action == "sync":
+                with store.lock:
+                    store.sources.pop(source_id, None)
+                    store.save()
+            return self.new_task(action, "Ran {0} on every mission of source {1}.".format(action, source_id))
+        match = BLOBS_RE.search(path)
+        if match is not None:
+            hashes = self.read_json().get("hashes", [])
+            return self.send_json(200, {"missing": [h for h in hashes if not store.has_blob(h)]})
+        match = DELTA_RE.search(path)
+        if match is not None:
+            return self.delta_sync(match.group(1), self.read_json())
+        self.read_body()
+        self.send_json(404, {"detail": "Not found."})
+
+    def delta_sync(self, source_id, data):
+        store = self.server.store
+        with store.lock:
+            current = store.sources.get(source_id)
+            if data.get("base") is not None:
+                if current is None or current["state"] != data["base"]:
+                    return self.send_json(409, {"detail": "The source doesn't match the base of the delta."})
+                missions = dict(current["missions"])
+            else:
+                missions = {}
+            for mission_id, mission in data["missions"].items():
+                absent = [name for name, blob_hash in mission["files"].items() if not store.has_blob(blob_hash)]
+                if len(absent) > 0:
+                    return self.send_json(400, {"detail": "Mission {0} is missing {1}.".format(mission_id, ", ".join(sorted(absent)))})
+                missions[mission_id] = mission
+            for mission_id in data.get("removed", []):
+                missions.pop(mission_id, None)
+            store.sources[source_id] = {"state": data["state"], "missions": missions}
+            store.save()
+        lines = ["Processed mission {0}.".format(k) for k in sorted(data["missions"])]
+        lines += ["Removed mission {0}.".format(k) for k in sorted(data.get("removed", []))]
+        lines.append("Source {0} has {1} missions.".format(source_id, len(missions)))
+        self.new_task("delta_sync", "\n".join(lines))
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stand-in Dataquest API for dqauthor.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data-dir", default=os.path.join(os.getcwd(), ".dq-stand-in"),
+                        help="Where to keep uploaded blobs and synced state.")
+    parser.add_argument("--sources", type=int, default=3, help="How many mission sources to list.")
+    parser.add_argument("--task-seconds", type=float, default=0.5, help="How long each task stays pending.")
+    parser.add_argument("--drop-every", type=int, default=0, help="Cut off every nth upload request halfway through.")
+    parser.add_argument("--forget", action="store_true", help="Forget what every source was synced with.")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    if args.forget and os.path.exists(args.data_dir):
+        shutil.rmtree(args.data_dir)
+    server = Server(("127.0.0.1", args.port), Handler)
+    server.store = Store(args.data_dir)
+    server.source_count = args.sources
+    server.task_seconds = args.task_seconds
+    server.drop_every = args.drop_every
+    server.put_count = 0
+    server.tasks = {}
+    server.task_ids = itertools.count(1)
+    server.quiet = args.quiet
+    print("Serving on http://127.0.0.1:{0}/api/v1/, keeping data in {1}".format(args.port, args.data_dir))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()